@@ -1,6 +1,8 @@
 from .extracted import ExtractedCitation
 from .citation import Citation
+from .features import CitationFeatures
 from .log import RunLog
+from .checkpoint import EnhanceCheckpoint
 from .nhm_pub import NHMPub
 from .manual_classification import ManualClassification
 from .enhancers.taxonomy import Taxonomy
@@ -0,0 +1,16 @@
+from sqlalchemy import Boolean, Column, Integer, String
+
+from . import decorators
+from ..session import Base
+
+
+@decorators.column_access
+@decorators.logged
+class EnhanceCheckpoint(Base):
+    __tablename__ = 'enhancecheckpoints'
+
+    id = Column(Integer, autoincrement=True, primary_key=True)
+    enhancer = Column(String(40))
+    # the last DOI (in DOI order) whose metadata has been stored
+    last_doi = Column(String(100), default=None)
+    complete = Column(Boolean, default=False)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Date, Integer, String
+from sqlalchemy import Column, Date, Index, Integer, String
 from sqlalchemy.dialects import mysql
 
 from ..session import Base
@@ -9,6 +9,8 @@ from . import decorators
 @decorators.logged
 class ExtractedCitation(Base):
     __tablename__ = 'extractedcitations'
+    # for finding the citations that are due to be identified
+    __table_args__ = (Index('extractedcitations_identify', 'doi', 'next_identify_run'),)
 
     id = Column(Integer, autoincrement=True, primary_key=True)
     email_id = Column(String(40))
@@ -25,3 +27,6 @@ class ExtractedCitation(Base):
     snippet_match = Column(Integer)
     highlight_length = Column(Integer)
     last_identify_run = Column(Date, default=None)
+    # the number of times it's been searched for without being identified, and when to try next
+    identify_attempts = Column(Integer, default=0)
+    next_identify_run = Column(Date, default=None)
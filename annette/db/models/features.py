@@ -0,0 +1,22 @@
+from sqlalchemy import Column, Float, ForeignKey, Integer
+
+from . import decorators
+from ..session import Base
+from .citation import Citation
+
+
+@decorators.column_access
+class CitationFeatures(Base):
+    # the classifier's input features for each citation, named as the model's features are
+    __tablename__ = 'citation_features'
+
+    doi = Column(ForeignKey(Citation.doi), primary_key=True)
+    nhm_sub = Column(Integer, default=0)
+    snippet_match = Column(Float)
+    highlight_length = Column(Float)
+    L_Label_1 = Column(Integer, default=0)
+    L_Label_2 = Column(Integer, default=0)
+    L_Label_3 = Column(Integer, default=0)
+    L_Label_4 = Column(Integer, default=0)
+    L_Label_5 = Column(Integer, default=0)
+    L_Label_8 = Column(Integer, default=0)
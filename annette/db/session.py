@@ -1,6 +1,9 @@
-from sqlalchemy import create_engine
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, inspect
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.schema import CreateColumn
 from datetime import datetime as dt
 import os
 
@@ -39,6 +42,20 @@ class SessionManager:
         self.session.close()
         self._scope.remove()
 
+    @contextmanager
+    def thread_session(self):
+        """
+        A separate session for use in a worker thread (sessions can't be shared between
+        threads). Objects loaded through it are detached when it closes but keep their loaded
+        values, so they can still be read and added to the main session afterwards.
+        :return: Session
+        """
+        session = self._factory(expire_on_commit=False)
+        try:
+            yield session
+        finally:
+            session.close()
+
     def complete(self, stage):
         setattr(self.runlog, stage, True)
 
@@ -49,6 +66,29 @@ class SessionManager:
 
     def create(self):
         Base.metadata.create_all(self._engine)
+        self.upgrade()
+
+    def upgrade(self):
+        """
+        Adds any columns and indexes that are missing from tables created by an earlier version
+        (create_all only creates tables that don't exist yet). New columns are filled with their
+        default value, if they have one.
+        """
+        inspector = inspect(self._engine)
+        with self._engine.begin() as connection:
+            for table in Base.metadata.sorted_tables:
+                existing = {c['name'] for c in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name in existing:
+                        continue
+                    column_ddl = CreateColumn(column).compile(dialect=self._engine.dialect)
+                    connection.execute(f'ALTER TABLE {table.name} ADD COLUMN {column_ddl}')
+                    if column.default is not None and column.default.is_scalar:
+                        connection.execute(table.update().values({column: column.default.arg}))
+                existing = {i['name'] for i in inspector.get_indexes(table.name)}
+                for index in table.indexes:
+                    if index.name not in existing:
+                        index.create(connection)
 
     def drop(self):
         from .models import RunLog
@@ -1,6 +1,7 @@
-import dill as pickle
 import pandas as pd
 from annette.db.session import engine
+from annette.stages.classify.features import FeatureStore
+from annette.utils.registry import model_registry
 import logging
 
 
@@ -13,9 +14,7 @@ class Classifier:
 
     @staticmethod
     def load_model():
-        with open('annette/data/model_forest.pk', 'rb') as f:
-            loaded_forest = pickle.load(f)
-        return loaded_forest
+        return model_registry().get('annette/data/model_forest.pk')
 
     @staticmethod
     def load_data():
@@ -24,31 +23,11 @@ class Classifier:
 
     @staticmethod
     def shape_data(df):
-        df3 = df.drop_duplicates().copy()
-
-        labels = ['Label_1', 'Label_2', 'Label_3', 'Label_4', 'Label_5', 'Label_8']
-
-        for l in labels:
-            if l in df3.iloc[:, -1:].values:
-                labels.remove(l)
-
-        df4 = pd.get_dummies(df3, columns=['label_id'], prefix='L')
-
-        for label in labels:
-            df4[f"L_{label}"] = 0
-
-        aggregations = {'nhm_sub': 'max',
-                        'snippet_match': 'mean',
-                        'highlight_length': 'mean',
-                        'L_Label_1': 'max',
-                        'L_Label_2': 'max',
-                        'L_Label_3': 'max',
-                        'L_Label_4': 'max',
-                        'L_Label_5': 'max',
-                        'L_Label_8': 'max'}
-
-        grouped_data = df4.groupby(['doi']).agg(aggregations).reset_index()
-
+        columns = ['doi', 'nhm_sub', 'snippet_match', 'highlight_length', 'label_id']
+        rows = df[columns].astype(object).where(df[columns].notna(), None).itertuples(index=False)
+        dois, features = FeatureStore.aggregate(map(tuple, rows))
+        grouped_data = pd.DataFrame(features, columns=FeatureStore.features)
+        grouped_data.insert(0, 'doi', dois)
         return grouped_data
 
     def classify(self):
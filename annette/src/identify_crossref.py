@@ -1,12 +1,17 @@
-from datetime import date
+from datetime import date, timedelta
+import json
 import logging
 from habanero import Crossref
 from fuzzywuzzy import fuzz
 from annette.db.models import Citation
+from annette.stages.identify._utils import concatenate_authors, partial_date
+from annette.utils.cache import response_cache
 from requests import HTTPError
 
 
 class IdentifyCrossRef:
+    cache_ttl = timedelta(weeks=4)
+
     def __init__(self, messages):
         self.messages = messages
         self.mail_to = "s.vincent@nhm.ac.uk"
@@ -32,13 +37,15 @@ class IdentifyCrossRef:
             pub_date = '1990-01-01' if message.pub_year is None else f"{message.pub_year}-01-01"
 
             try:
-                crossref_result = cr.works(
-                                        query=query,
-                                        filter={'from_pub_date': pub_date},
-                                        limit=1,
-                                        select='DOI,title,author,type,subject,container-title,'
-                                        'subject,publisher,issue,volume,page,ISSN,ISBN,published-online,'
-                                        'issued,link')
+                crossref_result = response_cache().lookup(
+                    'crossref', json.dumps([query, pub_date]),
+                    lambda: cr.works(query=query,
+                                     filter={'from_pub_date': pub_date},
+                                     limit=1,
+                                     select='DOI,title,author,type,subject,container-title,'
+                                     'subject,publisher,issue,volume,page,ISSN,ISBN,published-online,'
+                                     'issued,link'),
+                    self.cache_ttl)
 
                 # Update crossref date and skip if no results returned
                 if crossref_result['message']['total-results'] == 0:
@@ -94,30 +101,5 @@ class IdentifyCrossRef:
 
         return citation_results, self.messages
 
-    @staticmethod
-    def partial_date(part_date):
-        """
-        Parses partial dates and fills in missing values
-        :param part_date:
-        :return: Date
-        """
-        if part_date[0][0] is None:
-            return None
-        elif len(part_date[0]) == 3:
-            return date(part_date[0][0], part_date[0][1], part_date[0][2])
-        elif len(part_date[0]) == 2:
-            return date(part_date[0][0], part_date[0][1], 1)
-        elif len(part_date[0]) == 1:
-            return date(part_date[0][0], 7, 1)
-        else:
-            return None
-
-    @staticmethod
-    def concatenate_authors(authors):
-        """
-        Concatenates author list
-        :param authors:
-        :return: String of authors, semicolon delimited
-        """
-        return "; ".join([", ".join((n.get('family', ''), n.get('given', ''))) for n in authors]) \
-            if authors is not None else None
+    partial_date = staticmethod(partial_date)
+    concatenate_authors = staticmethod(concatenate_authors)
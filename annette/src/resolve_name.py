@@ -1,9 +1,12 @@
-from datetime import date
+from datetime import date, timedelta
 from pygbif import species
 from annette.db.models import Taxonomy
+from annette.utils.cache import response_cache
 
 
 class ResolveName:
+    cache_ttl = timedelta(weeks=12)
+
     def __init__(self, names):
         self.names = names
         self.taxonomy_results = []
@@ -12,7 +15,9 @@ class ResolveName:
         for name in self.names:
 
             # Get gbif-resolved name
-            result = species.name_lookup(q=name.label, limit=1)
+            result = response_cache().lookup('gbif', name.label,
+                                             lambda: species.name_lookup(q=name.label, limit=1),
+                                             self.cache_ttl)
 
             # Ignore any names which don't find a match (aka result is not empty)
             if result['results']:
@@ -11,14 +11,13 @@ from .identify_crossref import IdentifyCrossRef
 
 with SessionManager() as session_manager:
     # HARVEST STAGE
-    extracted_citations = HarvestCore.run(session_manager)
-    HarvestCore.store(session_manager, extracted_citations)
+    HarvestCore.stream(session_manager)
     session_manager.complete('harvest')
 
     # IDENTIFY STAGE
-    # citations = IdentifyCore.run()
-    # IdentifyCore.store(session_manager, citations)
-    # session_manager.complete('identify')
+    citations = IdentifyCore.run(session_manager)
+    IdentifyCore.store(session_manager, citations)
+    session_manager.complete('identify')
 
     # old code -------------------------------------------------------------------------------------
     # # Set cutoff to one month before current date
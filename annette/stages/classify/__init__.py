@@ -1,2 +1,3 @@
 from .core import ClassifyCore
 from ._base import BaseClassifier
+from .features import FeatureStore
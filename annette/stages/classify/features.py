@@ -0,0 +1,145 @@
+from sqlalchemy import bindparam, case, func, select
+
+from annette.db.models import Citation, CitationFeatures, ExtractedCitation, NHMPub
+from annette.utils.chunks import chunked
+from annette.utils.imports import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+
+class FeatureStore(object):
+    """
+    The classifier's features for each citation, kept in the citation_features table so they're
+    only worked out once (when the citation is identified) rather than from all the extracted
+    citations on every run.
+    """
+    # the extracted citations' labels that are features of the model
+    labels = ['Label_1', 'Label_2', 'Label_3', 'Label_4', 'Label_5', 'Label_8']
+    # the model's features, in order
+    features = ['nhm_sub', 'snippet_match', 'highlight_length'] + [f'L_{label}' for label in
+                                                                    labels]
+    # label id -> index of its column in the features (which come after the first three)
+    label_columns = {label: 3 + i for i, label in enumerate(labels)}
+
+    def __init__(self, session):
+        self.session = session
+
+    def read(self, dois):
+        """
+        Load the features for the DOIs, working out and storing any that haven't been yet.
+        :param dois: list of DOIs
+        :return: DataFrame with the doi and then the feature columns, one row per doi (if it has
+                 an extracted citation), sorted by doi
+        """
+        dois, matrix = self.read_matrix(dois)
+        features = pd.DataFrame(matrix, columns=self.features)
+        features.insert(0, 'doi', dois)
+        return features
+
+    def read_matrix(self, dois):
+        """
+        Like read, but returning the features as a float32 matrix (which the classifier can use
+        without copying it) rather than a DataFrame.
+        :param dois: list of DOIs
+        :return: tuple of (list of DOIs (if they have an extracted citation), sorted, and a
+                 matrix with the features for each)
+        """
+        rows = self._select(dois)
+        missing = sorted(set(dois) - {row['doi'] for row in rows})
+        if missing:
+            self.update(missing)
+            rows += self._select(missing)
+        rows.sort(key=lambda row: row['doi'])
+        matrix = np.empty((len(rows), len(self.features)), dtype=np.float32)
+        for i, row in enumerate(rows):
+            matrix[i] = row[1:]
+        # averages of only missing values are null
+        np.nan_to_num(matrix, copy=False)
+        return [row['doi'] for row in rows], matrix
+
+    @classmethod
+    def aggregate(cls, rows):
+        """
+        Work out the features from (doi, nhm_sub, snippet_match, highlight_length, label_id) rows
+        (e.g. the vw_classifier view) in Python, without going through a DataFrame. As in query,
+        repeated rows for a doi only count once.
+        :param rows: iterable of tuples, with None for missing values
+        :return: tuple of (array of DOIs, sorted, and a float32 matrix with the features for each)
+        """
+        rows = list(set(rows))
+        dois = sorted({row[0] for row in rows})
+        # the index of each row's doi, i.e. the row of the matrix it goes into
+        doi_index = {doi: i for i, doi in enumerate(dois)}
+        group = np.array([doi_index[row[0]] for row in rows], dtype=np.intp)
+        dois = np.array(dois, dtype=object)
+        matrix = np.zeros((len(dois), len(cls.features)), dtype=np.float32)
+
+        nhm_sub, snippet_match, highlight_length = [
+            np.array([row[i] for row in rows], dtype=float) for i in (1, 2, 3)]
+        label_ids = [row[4] for row in rows]
+        np.maximum.at(matrix[:, 0], group, np.nan_to_num(nhm_sub))
+        for column, values in [(1, snippet_match), (2, highlight_length)]:
+            present = ~np.isnan(values)
+            totals = np.bincount(group[present], weights=values[present], minlength=len(dois))
+            counts = np.bincount(group[present], minlength=len(dois))
+            np.divide(totals, counts, out=matrix[:, column], where=counts > 0, casting='unsafe')
+        columns = np.array([cls.label_columns.get(label, -1) for label in label_ids])
+        labelled = columns >= 0
+        matrix[group[labelled], columns[labelled]] = 1
+        return dois, matrix
+
+    def update(self, dois=None):
+        """
+        Work out and store the features for the DOIs, replacing any stored already. This is run
+        by the identify stage for new citations; run it for all of them (with no DOIs) after
+        changing the features or NHMPub.
+        :param dois: list of DOIs, or None for every citation
+        """
+        table = CitationFeatures.__table__
+        if dois is None:
+            dois = [doi for doi, in self.session.query(Citation.doi)]
+        with self.session.begin(subtransactions=True):
+            for chunk in chunked(dois):
+                self.session.execute(table.delete().where(table.c.doi.in_(chunk)))
+                self.session.execute(table.insert().from_select(['doi'] + self.features,
+                                                                self.query(chunk)))
+
+    def _select(self, dois):
+        table = CitationFeatures.__table__
+        q = select([table.c.doi] + [table.c[k] for k in self.features]).where(
+            table.c.doi.in_(bindparam('dois', expanding=True)))
+        rows = []
+        for chunk in chunked(dois):
+            rows += self.session.execute(q, {'dois': chunk}).fetchall()
+        return rows
+
+    def query(self, dois):
+        """
+        The query for working out the features of the given DOIs. This does the same as grouping
+        by doi and taking the max/mean of each column after one-hot encoding the label ids, but
+        in the database.
+        """
+        # first get the distinct combinations of values for each doi (i.e. ignoring how many times
+        # each was seen), as the model was trained on
+        distinct = self.session.query(
+            Citation.doi,
+            func.max(case([(NHMPub.issn.isnot(None), 1)], else_=0)).label('nhm_sub'),
+            ExtractedCitation.snippet_match,
+            ExtractedCitation.highlight_length,
+            ExtractedCitation.label_id)
+        distinct = distinct.join(ExtractedCitation)
+        distinct = distinct.outerjoin(NHMPub, Citation.issn == NHMPub.issn)
+        distinct = distinct.filter(Citation.doi.in_(dois))
+        distinct = distinct.group_by(Citation.doi, ExtractedCitation.snippet_match,
+                                     ExtractedCitation.highlight_length,
+                                     ExtractedCitation.label_id).subquery()
+
+        label_columns = [func.max(case([(distinct.c.label_id == label, 1)], else_=0)).label(
+            f'L_{label}') for label in self.labels]
+        q = select([distinct.c.doi,
+                    func.max(distinct.c.nhm_sub).label('nhm_sub'),
+                    func.avg(distinct.c.snippet_match).label('snippet_match'),
+                    func.avg(distinct.c.highlight_length).label('highlight_length')] +
+                   label_columns)
+        return q.group_by(distinct.c.doi)
@@ -1,38 +1,295 @@
 from abc import abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime as dt, timedelta
 
-from annette.db.models import Citation
+from sqlalchemy import Date, DateTime, Float, and_, bindparam, func, inspect, or_, select
+from sqlalchemy.orm import make_transient_to_detached
+
+from annette.db.models import Citation, EnhanceCheckpoint, RunLog
+from annette.utils.cache import response_cache
+from annette.utils.chunks import chunked
+from annette.utils.http import pooled_session
+from annette.utils.imports import lazy_import
+from annette.utils.rate import RateLimiter
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+requests = lazy_import('requests')
 
 
 class BaseEnhancer(object):
     """
     Get extra metadata for citations.
     """
+    # the enhancer/metadata model this enhancer creates
+    model = None
+    # how long before existing metadata for a citation should be fetched again
+    refresh_interval = timedelta(0)
+    # how long API responses are kept in the response cache
+    cache_ttl = timedelta(days=1)
+    # maximum number of requests per second to the enhancer's API; None for no limit
+    rate_limit = None
+    # number of requests that can be waiting for a response at once
+    workers = 1
+    # number of citations to enhance between commits; a checkpoint is recorded after each batch
+    commit_size = 500
 
-    def __init__(self, session_manager):
+    def __init__(self, session_manager, session=None):
+        """
+        :param session_manager: the SessionManager for the current run
+        :param session: the database session to use, if not the session manager's own (e.g. when
+                        running in another thread)
+        """
         self.session_manager = session_manager
+        self.session = session if session is not None else session_manager.session
+        self.rate_limiter = RateLimiter(self.rate_limit) if self.rate_limit else None
+        self._http = None
+        self._checkpoint = None
+        self.cache = response_cache()
 
     def get_data(self):
         """
-        Load the input data.
-        :return:
+        Load the relevant citations whose metadata is missing or out of date, after the checkpoint.
+        :return: list of Citation instances, sorted by DOI
         """
-        return self.session_manager.session.query(Citation).filter(Citation.classification_id is not None).all()
+        q = self.session.query(Citation).filter(Citation.classification_id == 1).order_by(
+            Citation.doi)
+        if self.checkpoint.last_doi is not None:
+            q = q.filter(Citation.doi > self.checkpoint.last_doi)
+        if self.model is None:
+            return q.all()
+        cutoff = dt.now() - self.refresh_interval
+        q = q.outerjoin(self.model, self.model.doi == Citation.doi)
+        q = q.outerjoin(RunLog, self.model.log_id == RunLog.id)
+        # entries from the current run have no end time yet but are up to date; other runs with
+        # no end time stopped without finishing, so go by when they started
+        run_time = func.coalesce(RunLog.end, RunLog.start)
+        q = q.filter(or_(self.model.id.is_(None), RunLog.id.is_(None),
+                         and_(RunLog.id != self.session_manager.runlog.id,
+                              or_(run_time.is_(None), run_time < cutoff))))
+        return q.distinct().all()
+
+    @property
+    def checkpoint(self):
+        """
+        The checkpoint for this run: the last one if it didn't finish, otherwise a new one.
+        :return: EnhanceCheckpoint
+        """
+        if self._checkpoint is None:
+            last = self.session.query(EnhanceCheckpoint).filter(
+                EnhanceCheckpoint.enhancer == type(self).__name__).order_by(
+                EnhanceCheckpoint.id.desc()).first()
+            if last is None or last.complete:
+                last = EnhanceCheckpoint(enhancer=type(self).__name__)
+            self._checkpoint = last
+        return self._checkpoint
+
+    def enhance(self, citations):
+        """
+        Get and store metadata for the citations in batches, moving the checkpoint on after each.
+        :param citations: list of Citation instances, sorted by DOI (as returned by get_data)
+        :return: list of new or changed enhancer/metadata instances (already stored)
+        """
+        checkpoint = self.checkpoint
+        checkpoint.log_id = self.session_manager.runlog.id
+        metadata = []
+        for i in range(0, len(citations), self.commit_size):
+            batch = citations[i:i + self.commit_size]
+            batch_metadata = self.session_manager.log(self.get_all_metadata(batch))
+            checkpoint.last_doi = batch[-1].doi
+            # the batch, the checkpoint and the checked entries are committed together
+            with self.session.begin(subtransactions=True):
+                self.store_metadata(batch_metadata + [checkpoint])
+                self.mark_checked([c.doi for c in batch])
+            metadata += batch_metadata
+        checkpoint.complete = True
+        self.store_metadata([checkpoint])
+        return metadata
 
-    @abstractmethod
     def get_metadata(self, citation):
         """
         Get extra metadata about the citation.
         :return: list of enhancer/metadata instances
         """
+        return self.get_all_metadata([citation])
+
+    def get_all_metadata(self, citations):
+        """
+        Get extra metadata about several citations; changed entries are returned detached.
+        :param citations: list of Citation instances
+        :return: list of new or changed enhancer/metadata instances
+        """
+        new, changed = self.diff_metadata(self.fetch_all_metadata([c.doi for c in citations]))
+        metadata = [self.model(**row_values) for row_values in new]
+        for row_values in changed:
+            instance = self.model(**row_values)
+            make_transient_to_detached(instance)
+            metadata.append(instance)
+        return metadata
+
+    def fetch_all_metadata(self, dois):
+        """
+        Request metadata about several DOIs, calling fetch_metadata from a pool of worker threads.
+        :param dois: list of DOIs
+        :return: list of dicts of values for the enhancer/metadata model (or None), in the same
+                 order as the DOIs
+        """
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(self.fetch_metadata, dois))
+
+    def get_previous(self, dois):
+        """
+        Load the existing entries for the DOIs without building model instances.
+        :param dois: list of DOIs
+        :return: list of rows (tuples of column values, in the order of model.columns())
+        """
+        table = self.model.__table__
+        q = select([table.c[k] for k in self.model.columns()]).where(
+            table.c.doi.in_(bindparam('dois', expanding=True)))
+        rows = []
+        for chunk in chunked(dois):
+            rows += self.session.execute(q, {'dois': chunk}).fetchall()
+        return rows
+
+    def diff_metadata(self, all_row_values):
+        """
+        Compare fetched values with the existing entries for their DOIs.
+        :param all_row_values: list of dicts of values for the enhancer/metadata model (or None)
+        :return: tuple of (list of values for new entries, list of all the values for entries
+                 that have changed, i.e. the existing entry's values updated with the new ones)
+        """
+        all_row_values = [v for v in all_row_values if v is not None]
+        if not all_row_values:
+            return [], []
+        columns = list(self.model.columns())
+        fetched = pd.DataFrame.from_records(all_row_values)
+        previous_rows = self.get_previous(fetched['doi'].unique().tolist())
+        previous = pd.DataFrame.from_records(previous_rows, columns=columns)
+        previous['_row'] = np.arange(len(previous_rows))
+        # if there's more than one entry for a DOI, compare with the first
+        previous = previous.sort_values('id').drop_duplicates('doi')
+        merged = fetched.merge(previous, on='doi', how='left', suffixes=('', '_previous'))
+        previous_row = merged['_row'].values
+        is_new = np.isnan(previous_row)
+        changed = np.zeros(len(merged), dtype=bool)
+        for k in fetched.columns.drop('doi'):
+            changed |= ~self._equal(self.model.__table__.c[k].type, merged[k],
+                                    merged[k + '_previous'])
+        new = [all_row_values[i] for i in np.flatnonzero(is_new)]
+        changed = [dict(zip(columns, previous_rows[int(previous_row[i])]), **all_row_values[i])
+                   for i in np.flatnonzero(changed & ~is_new)]
+        return new, changed
+
+    @staticmethod
+    def _equal(column_type, fetched, previous):
+        """
+        Compare a column of fetched values with the stored ones.
+        :return: boolean array, true where the values are the same
+        """
+        if isinstance(column_type, (Date, DateTime)):
+            fetched = pd.to_datetime(fetched)
+            previous = pd.to_datetime(previous)
+            if isinstance(column_type, Date):
+                fetched = fetched.dt.normalize()
+        elif isinstance(column_type, Float):
+            # FLOAT columns are single precision, so don't count the rounding as a change
+            fetched = pd.to_numeric(fetched).values.astype(float)
+            previous = pd.to_numeric(previous).values.astype(float)
+            return np.isclose(fetched, previous, rtol=1e-6, equal_nan=True)
+        both_missing = fetched.isna().values & previous.isna().values
+        return (fetched == previous).values.astype(bool) | both_missing
+
+    @abstractmethod
+    def fetch_metadata(self, doi):
+        """
+        Request metadata about a DOI from an external source (in a worker thread).
+        :param doi: the DOI to look up
+        :return: dict of values for the enhancer/metadata model, or None if nothing was found
+        """
         pass
 
+    @property
+    def http(self):
+        """
+        A requests session shared by the worker threads.
+        :return: requests.Session
+        """
+        if self._http is None:
+            self._http = pooled_session(self.workers)
+        return self._http
+
+    def cached_get(self, url):
+        """
+        GETs JSON from the API via the response cache, keeping to the rate limit.
+        :param url: the URL to request
+        :return: the parsed JSON response, or None if the request failed
+        """
+
+        def _get():
+            self.throttle()
+            r = self.http.get(url)
+            if r.status_code == 404:
+                return None
+            if not r.ok:
+                r.raise_for_status()
+            return r.json()
+
+        try:
+            return self.cache.lookup(type(self).__name__, url, _get, self.cache_ttl)
+        except requests.HTTPError:
+            return None
+
+    def throttle(self):
+        """
+        Wait until the next request is allowed by the rate limit.
+        """
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+
     def store_metadata(self, metadata):
         """
-        Store the extracted citation data.
+        Store the metadata; detached instances are written with a bulk UPDATE.
+        :param metadata: list of enhancer/metadata instances
         :return:
         """
-        self.session_manager.session.add_all(metadata)
-        self.session_manager.session.flush()
+        updated = {}
+        for m in metadata:
+            if inspect(m).detached:
+                updated.setdefault(type(m), []).append(inspect(m).dict)
+        with self.session.begin(subtransactions=True):
+            for model, all_row_values in updated.items():
+                self.update_metadata(model, all_row_values)
+            self.session.add_all([m for m in metadata if not inspect(m).detached])
+
+    def update_metadata(self, model, all_row_values):
+        """
+        Update existing entries with a single UPDATE statement.
+        :param model: the enhancer/metadata model
+        :param all_row_values: list of dicts of values for the model, including the id of the
+                               entry to update
+        """
+        if not all_row_values:
+            return
+        table = model.__table__
+        # every set of parameters has to have the same keys
+        columns = set.intersection(*[set(row_values) for row_values in all_row_values])
+        columns = [k for k in model.columns() if k in columns and k != 'id']
+        self.session.execute(table.update().where(table.c.id == bindparam('_id')),
+                             [dict({k: row_values[k] for k in columns}, _id=row_values['id'])
+                              for row_values in all_row_values])
+
+    def mark_checked(self, dois):
+        """
+        Move the existing entries for the DOIs to the current run's log, so they're up to date.
+        :param dois: the DOIs whose metadata has just been requested
+        """
+        if self.model is None or not dois:
+            return
+        table = self.model.__table__
+        q = table.update().where(table.c.doi.in_(bindparam('dois', expanding=True))).values(
+            log_id=self.session_manager.runlog.id)
+        for chunk in chunked(dois):
+            self.session.execute(q, {'dois': chunk})
 
     @property
     def run_now(self):
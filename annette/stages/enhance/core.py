@@ -1,3 +1,8 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import inspect
+
+from annette.utils.cache import response_cache
 from ._utils import logger
 from ._base import BaseEnhancer
 from .dimensions import DimensionsEnhancer
@@ -9,22 +14,55 @@ class EnhanceCore:
 
     @classmethod
     def run(cls, session_manager):
+        """
+        Run the enhancers. Each one stores its metadata in batches as it goes (see
+        BaseEnhancer.enhance), so an interrupted run can be resumed.
+        :return: list of the new or changed enhancer/metadata instances
+        """
         logger.debug('Beginning enhance stage')
         metadata = []
-        for enhancer_type in cls.enhancers:
-            enhancer = enhancer_type(session_manager)
-            if enhancer.run_now:
+        # the enhancers use different APIs and tables, so run them side by side; each has its own
+        # session and rate limiter, and the results are merged here
+        with ThreadPoolExecutor(max_workers=len(cls.enhancers)) as executor:
+            futures = [executor.submit(cls._run_enhancer, session_manager, enhancer_type) for
+                       enhancer_type in cls.enhancers]
+            for future in futures:
+                metadata += cls._attach(session_manager.session, future.result())
+        response_cache().log_stats()
+        logger.debug(f'Finished enhancing. {len(metadata)} new pieces of metadata found.')
+        return metadata
+
+    @classmethod
+    def _run_enhancer(cls, session_manager, enhancer_type):
+        with session_manager.thread_session() as session:
+            enhancer = enhancer_type(session_manager, session=session)
+            last_doi = enhancer.checkpoint.last_doi
+            if last_doi is not None:
+                logger.debug(f'Resuming {enhancer_type.__name__} after {last_doi}.')
+            elif enhancer.run_now:
                 logger.debug(f'Running {enhancer_type.__name__}.')
-                citations = enhancer.get_data()
-                for citation in citations:
-                    metadata += enhancer.get_metadata(citation)
             else:
                 logger.debug(f'Not running {enhancer_type.__name__} at this time.')
-        session_manager.log(metadata)
-        logger.debug(f'Finished enhancing. {len(metadata)} new pieces of metadata found.')
-        return metadata
+                return []
+            metadata = enhancer.enhance(enhancer.get_data())
+            logger.debug(f'{enhancer_type.__name__} found {len(metadata)} new pieces of metadata.')
+            return metadata
+
+    @staticmethod
+    def _attach(session, metadata):
+        """
+        The enhancers' entries come back detached from their own sessions, already stored. Add
+        them to the main session (or, if it already has its own copy of one, copy the values onto
+        that) so they aren't written again by store.
+        :return: list of enhancer/metadata instances in the main session
+        """
+        identity_map = session.identity_map
+        attached = [session.merge(m) if inspect(m).key in identity_map else m for m in metadata]
+        session.add_all(attached)
+        return attached
 
     @classmethod
     def store(cls, session_manager, metadata):
+        # run has already committed the enhancers' metadata; this only saves any later changes
         BaseEnhancer(session_manager).store_metadata(metadata)
         logger.debug(f"{len(metadata)} new pieces of metadata stored.")
@@ -1,47 +1,127 @@
-import time
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime as dt, timedelta
 
-import requests
-
 from annette.db.models import Metrics, RunLog
+from annette.utils.imports import lazy_import
+from annette.utils.rate import RateLimiter
 from ._base import BaseEnhancer
 
+requests = lazy_import('requests')
+
 
 class DimensionsEnhancer(BaseEnhancer):
-    def get_metadata(self, citation):
-        # find any previous entries for this doi
-        previous = self.session_manager.session.query(Metrics).filter(
-            Metrics.doi == citation.doi).first()
+    model = Metrics
+    refresh_interval = timedelta(weeks=4)
+    cache_ttl = timedelta(weeks=1)
+    # Throttle query rate to comply with API terms of use
+    rate_limit = 1
+    workers = 4
+
+    # the metrics API only takes one DOI at a time, but the (authenticated) DSL API can look up
+    # many; it's used when an API key is set
+    metrics_url = 'https://metrics-api.dimensions.ai/doi'
+    dsl_url = 'https://app.dimensions.ai/api'
+    api_key = os.environ.get('DIMENSIONS_API_KEY')
+    # number of DOIs per DSL query; None to always use the metrics API
+    batch_size = 250
+    # the DSL API allows 30 requests a minute
+    batch_rate_limit = 0.5
+    fields = ['times_cited', 'recent_citations', 'relative_citation_ratio',
+              'field_citation_ratio']
+
+    def __init__(self, session_manager, session=None):
+        super(DimensionsEnhancer, self).__init__(session_manager, session=session)
+        self.batch_rate_limiter = RateLimiter(self.batch_rate_limit)
+        self._token = None
+        self._token_lock = threading.Lock()
+
+    def fetch_metadata(self, doi):
+        response = self.cached_get(f'{self.metrics_url}/{doi}')
+        return self._row_values(doi, response)
+
+    def fetch_all_metadata(self, dois):
+        """
+        Request metrics for several DOIs, using one DSL query per batch_size DOIs if an API key
+        is set and one metrics API request per DOI otherwise.
+        :param dois: list of DOIs
+        :return: list of dicts of values for Metrics (or None), in the same order as the DOIs
+        """
+        if self.api_key is None or not self.batch_size:
+            return super(DimensionsEnhancer, self).fetch_all_metadata(dois)
+        batches = [dois[i:i + self.batch_size] for i in range(0, len(dois), self.batch_size)]
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for batch_results in executor.map(self.fetch_batch, batches):
+                results.update(batch_results)
+        return [results.get(doi) for doi in dois]
+
+    def fetch_batch(self, dois):
+        """
+        Request metrics for a batch of DOIs with a single DSL query, falling back to one request
+        per DOI if the query fails or its response isn't what was expected. Responses are cached
+        per DOI, under the same keys as the single requests.
+        :param dois: list of DOIs
+        :return: dict of doi -> dict of values for Metrics (or None)
+        """
+        urls = {f'{self.metrics_url}/{doi}': doi for doi in dois}
 
-        # Throttle query rate to comply with API terms of use
-        time.sleep(1)
-        url = f'https://metrics-api.dimensions.ai/doi/{citation.doi}'
+        def _query(missing):
+            found = self.query_dsl([urls[url] for url in missing])
+            return {url: found.get(urls[url].lower()) for url in missing}
 
         try:
-            r = requests.get(url)
-            if not r.ok:
+            responses = self.cache.lookup_many(type(self).__name__, list(urls), _query,
+                                               self.cache_ttl)
+        except (requests.RequestException, ValueError, KeyError):
+            return {doi: self.fetch_metadata(doi) for doi in dois}
+        return {doi: self._row_values(doi, responses[url]) for url, doi in urls.items()}
+
+    def query_dsl(self, dois):
+        """
+        Search the DSL API for publications with the given DOIs.
+        :param dois: list of DOIs
+        :return: dict of lowercase doi -> publication (a dict of the metrics fields); DOIs that
+                 weren't found are left out
+        """
+        # DOIs can contain quotes and backslashes, so escape them for the DSL's string syntax
+        doi_list = ', '.join(json.dumps(d, ensure_ascii=False) for d in dois)
+        fields = '+'.join(['doi'] + self.fields)
+        query = f'search publications where doi in [{doi_list}] ' \
+                f'return publications[{fields}] limit {len(dois)}'
+        for retry in (True, False):
+            self.batch_rate_limiter.acquire()
+            r = self.http.post(f'{self.dsl_url}/dsl.json', data=query.encode(),
+                               headers={'Authorization': f'JWT {self.token}'})
+            # tokens expire after a while; get a new one and try again
+            if r.status_code == 401 and retry:
+                self._token = None
+                continue
+            r.raise_for_status()
+            # a response without any publications is an error, not a search that found nothing
+            return {p['doi'].lower(): p for p in r.json()['publications']}
+
+    @property
+    def token(self):
+        """
+        An access token for the DSL API, requested using the API key.
+        :return: str
+        """
+        with self._token_lock:
+            if self._token is None:
+                r = self.http.post(f'{self.dsl_url}/auth.json', json={'key': self.api_key})
                 r.raise_for_status()
-        except requests.HTTPError:
-            return []
-
-        row_values = {
-            'times_cited': r.json()['times_cited'] or 0,
-            'recent_citations': r.json()['recent_citations'] or 0,
-            'relative_citation_ratio': r.json()['relative_citation_ratio'] or 0,
-            'field_citation_ratio': r.json()['field_citation_ratio'] or 0,
-            'doi': citation.doi
-            }
-
-        if previous is None:
-            return [Metrics(**row_values)]
-        else:
-            changed = False
-            for k, v in row_values.items():
-                if str(getattr(previous, k)) == str(v):
-                    continue
-                setattr(previous, k, v)
-                changed = True
-            return [previous] if changed else []
+                self._token = r.json()['token']
+            return self._token
+
+    def _row_values(self, doi, response):
+        if response is None:
+            return None
+        row_values = {k: response.get(k) or 0 for k in self.fields}
+        row_values['doi'] = doi
+        return row_values
 
     @property
     def run_now(self):
@@ -49,9 +129,10 @@ class DimensionsEnhancer(BaseEnhancer):
         Run every four weeks.
         :return:
         """
-        last_run = self.session_manager.session.query(Metrics).join(RunLog).order_by(
+        # runs that didn't finish (including this one) have no end time
+        last_run = self.session.query(Metrics).join(RunLog).filter(RunLog.end.isnot(None)).order_by(
             RunLog.end.desc()).first()
         if last_run is None:
             return True
         else:
-            return last_run.log.end < (dt.now() - timedelta(weeks=4))
+            return last_run.log.end < (dt.now() - self.refresh_interval)
@@ -1,19 +1,29 @@
+import itertools
 from abc import abstractmethod
-from pymysql.err import InternalError
+
+from sqlalchemy import inspect
+from sqlalchemy.exc import DataError, IntegrityError, InternalError
+
+from annette.db.models import ExtractedCitation
+from . import _utils
+
 
 class BaseHarvester(object):
     """
     Load, parse, and store basic citation data from a source.
     """
+    # number of citations inserted into the database at a time
+    chunk_size = 500
 
     def __init__(self, session_manager):
         self.session_manager = session_manager
+        self.rejected = []
 
     @abstractmethod
     def get_data(self):
         """
         Load the input data.
-        :return:
+        :return: iterable of input items (e.g. emails); ideally a generator
         """
         pass
 
@@ -21,19 +31,136 @@ class BaseHarvester(object):
     def parse_data(self, data):
         """
         Parse the input data to retrieve basic citation data.
-        :return: list of ExtractedCitation instances
+        :return: iterable of ExtractedCitation instances; ideally a generator
         """
         pass
 
     def store_citations(self, extracted_citations):
         """
-        Store the extracted citation data.
-        :return:
+        Store the extracted citation data in chunks, skipping emails that are already stored.
+        :param extracted_citations: iterable of ExtractedCitation instances, with the citations
+                                    from each email next to each other
+        :return: the number of citations stored
+        """
+        stored = 0
+        for chunk in self._chunk_by_email(extracted_citations):
+            email_ids = [c.email_id for c in chunk]
+            chunk = self._skip_stored(chunk)
+            if chunk:
+                self.session_manager.log(chunk)
+                stored += self._insert_citations(chunk)
+            self.mark_stored(email_ids)
+        if self.rejected:
+            _utils.logger.warning(f'{len(self.rejected)} citations could not be stored.')
+        return stored
+
+    def mark_stored(self, email_ids):
+        """
+        Called with the IDs of the emails whose citations have been stored, e.g. to mark them as
+        read so they aren't harvested again.
+        :param email_ids: list of email IDs
+        """
+        pass
+
+    def _chunk_by_email(self, extracted_citations):
+        """
+        Split the citations into chunks of (about) chunk_size without splitting any email's.
+        :param extracted_citations: iterable of ExtractedCitation instances
+        :return: generator of lists of ExtractedCitation instances
+        """
+        chunk = []
+        for _, citations in itertools.groupby(extracted_citations, key=lambda c: c.email_id):
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+            chunk.extend(citations)
+        if chunk:
+            yield chunk
+
+    def _skip_stored(self, extracted_citations):
+        """
+        Leave out citations from emails that already have citations in the database.
+        :param extracted_citations: list of ExtractedCitation instances
+        :return: list of ExtractedCitation instances
+        """
+        email_ids = list({c.email_id for c in extracted_citations if c.email_id is not None})
+        if not email_ids:
+            return extracted_citations
+        q = self.session_manager.session.query(ExtractedCitation.email_id).filter(
+            ExtractedCitation.email_id.in_(email_ids)).distinct()
+        stored = {email_id for email_id, in q}
+        if stored:
+            _utils.logger.debug(f'Skipping citations from {len(stored)} emails that have already '
+                                f'been stored.')
+        return [c for c in extracted_citations if c.email_id not in stored]
+
+    def _insert_citations(self, extracted_citations):
+        """
+        Insert the citations in one INSERT, retrying email by email to reject any with bad rows.
+        :param extracted_citations: list of ExtractedCitation instances
+        :return: the number of citations inserted
         """
-        self.session_manager.session.add_all(extracted_citations)
+        insert = ExtractedCitation.__table__.insert()
+        rows = [self._row_values(c) for c in extracted_citations]
         try:
-            self.session_manager.session.flush()
-        except InternalError as e:
-            extracted_citations = [c for c in extracted_citations if c.email_id != e.params['email_id']]
-            self.store_citations(extracted_citations)
+            self.session_manager.session.execute(insert, rows)
+            return len(rows)
+        except (DataError, IntegrityError, InternalError) as e:
+            if not self._is_bad_row(e):
+                raise
 
+        inserted = 0
+        rejected = []
+        error = None
+        pairs = zip(extracted_citations, rows)
+        for email_id, email_pairs in itertools.groupby(pairs, key=lambda p: p[0].email_id):
+            citations, email_rows = zip(*email_pairs)
+            try:
+                self.session_manager.session.execute(insert, list(email_rows))
+                inserted += len(email_rows)
+            except (DataError, IntegrityError, InternalError) as e:
+                if not self._is_bad_row(e):
+                    raise
+                _utils.logger.warning(
+                    f'Could not store {len(citations)} citations from email {email_id}: {e.orig}')
+                rejected.append(citations)
+                error = e
+        # if every email has a bad row, it's more likely to be the table than the rows
+        if len(rejected) > 1 and not inserted:
+            raise error
+        for citations in rejected:
+            self.rejected += citations
+        return inserted
+
+    @staticmethod
+    def _is_bad_row(error):
+        """
+        Whether the database error was caused by the values in a row (rather than e.g. the schema
+        or a lock timeout, which would affect every row).
+        :param error: a DataError, IntegrityError, or InternalError
+        :return: bool
+        """
+        if isinstance(error, (DataError, IntegrityError)):
+            return True
+        # MySQL reports an incorrect string value (e.g. a 4-byte character in a utf8 column) as
+        # an InternalError
+        return getattr(error.orig, 'args', ())[:1] == (1366,)
+
+    @staticmethod
+    def _row_values(extracted_citation):
+        """
+        The values to insert for the citation, using column defaults for values that aren't set.
+        :param extracted_citation: ExtractedCitation instance
+        :return: dict of column name -> value
+        """
+        table = ExtractedCitation.__table__
+        set_values = inspect(extracted_citation).dict
+        row = {}
+        for k, v in extracted_citation.get_values().items():
+            if k == 'id':
+                continue
+            default = table.c[k].default
+            if k not in set_values and default is not None and default.is_scalar:
+                v = default.arg
+            row[k] = v
+        return row
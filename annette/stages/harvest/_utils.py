@@ -1,14 +1,25 @@
 import itertools
 import re
 import unicodedata
-import emoji
-import nltk
 
+from annette.utils.imports import lazy_import
 from annette.utils.log import get_logger
 
+emoji = lazy_import('emoji')
+nltk = lazy_import('nltk')
+
 logger = get_logger('annette.harvest')
 
-nltk.download('punkt')
+
+def check_nltk_data():
+    """
+    Checks the NLTK tokeniser data is installed. This never downloads anything; the data is
+    installed by deploy/download_nltk.py when the container is built.
+    """
+    try:
+        nltk.word_tokenize('Natural History Museum')
+    except LookupError as e:
+        raise LookupError('NLTK punkt data not found; run deploy/download_nltk.py.') from e
 
 
 def clean_string(string):
@@ -20,25 +31,45 @@ def clean_string(string):
     return emoji.demojize(unicodedata.normalize("NFKD", string).replace("...", "").strip())
 
 
-def minimum_word_distance(string):
-    single_tokens = ["nhmuk", "nhml", "bmnh", "10.5519"]
-    phrase_tokens = [('bm', 'nh'),
-                     ('natural', 'history', 'museum', 'london')]
+_word_pattern = re.compile(r'\w')
+_single_tokens = frozenset(["nhmuk", "nhml", "bmnh", "10.5519"])
+_phrase_tokens = [('bm', 'nh'),
+                  ('natural', 'history', 'museum', 'london')]
+_phrase_words = frozenset(itertools.chain.from_iterable(_phrase_tokens))
 
-    tokens = [t.lower() for t in nltk.word_tokenize(string) if re.match('.*\w.*', t)]
-    for label in single_tokens:
-        if label in tokens:
+
+def minimum_word_distance(string):
+    """
+    Finds how closely the words of an NHM-identifying phrase (e.g. "natural history museum
+    london") appear together in a string, i.e. the number of extra words in the shortest span
+    that contains the whole phrase. Works in a single pass over the tokens, tracking where each
+    phrase word was last seen.
+    :param string: the text to search, e.g. a Google Scholar snippet
+    :return: 0 if an identifying single token is present, the minimum distance if a full phrase
+             is present, or None if neither is found
+    """
+    last_seen = {}
+    phrase_min_distances = [None] * len(_phrase_tokens)
+    i = -1
+    for token in nltk.word_tokenize(string):
+        # only count tokens containing at least one word character
+        if _word_pattern.search(token) is None:
+            continue
+        i += 1
+        token = token.lower()
+        if token in _single_tokens:
             return 0
-    min_distance = None
-    for phrase in phrase_tokens:
-        if not all([p in tokens for p in phrase]):
+        if token not in _phrase_words:
             continue
-        indices = [[i for i, t in enumerate(tokens) if t == p] for p in phrase]
-        phrase_min_distance = min([max(x) - min(x) for x in itertools.product(*indices)])
-        # account for differences in phrase length
-        phrase_min_distance -= len(phrase) - 1
-        if min_distance is None:
-            min_distance = phrase_min_distance
-        else:
-            min_distance = min(min_distance, phrase_min_distance)
-    return min_distance
+        last_seen[token] = i
+        for p, phrase in enumerate(_phrase_tokens):
+            if token not in phrase or not all([w in last_seen for w in phrase]):
+                continue
+            # the shortest span ending here starts at the least recently seen phrase word
+            span = i - min([last_seen[w] for w in phrase])
+            if phrase_min_distances[p] is None or span < phrase_min_distances[p]:
+                phrase_min_distances[p] = span
+    # account for differences in phrase length
+    distances = [d - (len(phrase) - 1) for d, phrase in zip(phrase_min_distances, _phrase_tokens)
+                 if d is not None]
+    return min(distances) if distances else None
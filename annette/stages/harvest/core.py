@@ -1,4 +1,4 @@
-from ._utils import logger
+from ._utils import check_nltk_data, logger
 from .gmail import GmailHarvester
 from ._base import BaseHarvester
 
@@ -9,6 +9,7 @@ class HarvestCore:
     @classmethod
     def run(cls, session_manager):
         logger.debug('Beginning harvest')
+        check_nltk_data()
         extracted_citations = []
         for harvester_type in cls.harvesters:
             logger.debug(f'Running {harvester_type.__name__}')
@@ -23,3 +24,21 @@ class HarvestCore:
     def store(cls, session_manager, extracted_citations):
         BaseHarvester(session_manager).store_citations(extracted_citations)
         logger.debug(f"{len(extracted_citations)} new citations written to extractedcitations.")
+
+    @classmethod
+    def stream(cls, session_manager):
+        """
+        Harvests and stores in one go: emails are loaded, parsed and stored lazily, and citations
+        are written to the database in chunks, so memory use doesn't grow with the number of
+        new emails and a crash part-way through keeps the chunks already stored.
+        :return: the number of citations stored
+        """
+        logger.debug('Beginning streaming harvest')
+        check_nltk_data()
+        stored = 0
+        for harvester_type in cls.harvesters:
+            logger.debug(f'Running {harvester_type.__name__}')
+            harvester = harvester_type(session_manager)
+            stored += harvester.store_citations(harvester.parse_data(harvester.get_data()))
+        logger.debug(f'Finished harvest. {stored} new citations written to extractedcitations.')
+        return stored
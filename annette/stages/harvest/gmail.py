@@ -1,48 +1,89 @@
 import argparse
 import base64
 import re
+from concurrent.futures import ProcessPoolExecutor
 from datetime import date
 
-import httplib2
-from apiclient import discovery, errors
-from bs4 import BeautifulSoup
-from oauth2client import client, tools
-from oauth2client.file import Storage
-
 from annette.db.models import ExtractedCitation
+from annette.utils.chunks import chunked
+from annette.utils.imports import lazy_import
 from . import _utils
 from ._base import BaseHarvester
 
+bs4 = lazy_import('bs4')
+client = lazy_import('oauth2client.client')
+discovery = lazy_import('apiclient.discovery')
+errors = lazy_import('apiclient.errors')
+httplib2 = lazy_import('httplib2')
+oauth_file = lazy_import('oauth2client.file')
+tools = lazy_import('oauth2client.tools')
+
 
 class GmailHarvester(BaseHarvester):
     scopes = 'https://www.googleapis.com/auth/gmail.modify'
     client_secret_file = 'annette/data/client_secret.json'
     application_name = 'DCP Pipeline'
+    # maximum number of message requests grouped into one Gmail batch request; Gmail allows up to
+    # 100 but recommends 50 or fewer to avoid rate limiting. Set to None to fetch one at a time.
+    batch_size = 50
+    # number of processes used to parse emails in parallel; None parses them in this process
+    parse_workers = None
 
     def __init__(self, session_manager):
         super(GmailHarvester, self).__init__(session_manager)
         self.service = self.get_credentials()
+        self.retrieved_ids = []
+        self.read_ids = set()
 
     def get_data(self):
         """
         Runs class logic: controls flow of authentication,
         message retrieval and inbox updates.
 
-        :return: List of Messages constructed by MessageFactory.
-        These messages have been retrieved from the Gmail inbox and parsed to extract metadata.
+        :return: generator of email dicts constructed by GmailParser.
+        These messages are retrieved from the Gmail inbox as the generator is consumed.
         """
         unread_emails = self.list_unread_emails()
         factory = GmailParser(self.service)
 
         _utils.logger.debug(f"Starting harvest. {len(unread_emails)} new emails found.")
 
-        return [factory.get_email(unread['id']) for unread in unread_emails]
+        if not self.batch_size:
+            emails = (factory.get_email(unread['id']) for unread in unread_emails)
+        else:
+            emails = factory.get_emails([unread['id'] for unread in unread_emails],
+                                        batch_size=self.batch_size)
+        for email in emails:
+            self.retrieved_ids.append(email['id'])
+            yield email
+
+    def store_citations(self, extracted_citations):
+        stored = super(GmailHarvester, self).store_citations(extracted_citations)
+        # emails without any citations aren't in any of the chunks
+        self.mark_stored(self.retrieved_ids)
+        return stored
+
+    def mark_stored(self, email_ids):
+        """
+        Mark the emails as read, so they aren't harvested again.
+        :param email_ids: list of email IDs
+        """
+        email_ids = [i for i in dict.fromkeys(email_ids) if i not in self.read_ids]
+        GmailParser(self.service).mark_emails_read(email_ids)
+        self.read_ids.update(email_ids)
 
     def parse_data(self, data):
-        extracted_citations = []
-        for email in data:
-            extracted_citations += GmailParser.parse_email(email)
-        return extracted_citations
+        if not self.parse_workers or self.parse_workers < 2:
+            for email in data:
+                yield from GmailParser.parse_email(email)
+            return
+
+        # parse in chunks so the input generator is never loaded into memory all at once;
+        # executor.map returns results in input order, so the output order is deterministic
+        with ProcessPoolExecutor(max_workers=self.parse_workers) as executor:
+            for emails in chunked(data, self.parse_workers * 4):
+                for records in executor.map(GmailParser.parse_email_records, emails):
+                    yield from (ExtractedCitation(**record) for record in records)
 
     def get_credentials(self):
         """
@@ -54,7 +95,7 @@ class GmailHarvester(BaseHarvester):
         """
         credential_path = 'annette/data/gmail-credentials.json'
 
-        store = Storage(credential_path)
+        store = oauth_file.Storage(credential_path)
         credentials = store.get()
         flags = argparse.ArgumentParser(parents=[tools.argparser]).parse_args()
 
@@ -120,23 +161,35 @@ class GmailHarvester(BaseHarvester):
 
 
 class GmailParser(object):
+    # the BeautifulSoup tree builder used for email bodies; lxml is faster than the pure-Python
+    # html.parser, which is used instead if lxml isn't installed
+    html_parser = 'lxml'
+
     def __init__(self, service):
         self.service = service
 
     @classmethod
     def parse_email(cls, email):
-        soup = BeautifulSoup(email['body'], 'html.parser')
+        return [ExtractedCitation(**record) for record in cls.parse_email_records(email)]
+
+    @classmethod
+    def parse_email_records(cls, email):
+        """
+        Does the actual parsing for parse_email, but returns plain dicts of ExtractedCitation
+        values rather than model instances so it can be run in a separate process.
+        :param email: email dict, as returned by get_email
+        :return: list of dicts
+        """
+        soup = cls._make_soup(email['body'])
 
-        raw_citations = soup('h3')
         extracted_citations = []
 
-        for i in raw_citations:
+        for i, snippet in cls._find_citations(soup):
             # Retrieve + parse bib_data
             bib_data = i.find_next_sibling('div')
             parsed_bib_data = cls._parse_email_bib_data(_utils.clean_string(bib_data.text))
 
             # Get snippet + features from highlights
-            snippet = i.find_next(class_='gse_alrt_sni')
             if snippet is None:
                 snippet_distance = None
                 snippet_clean = ''
@@ -149,23 +202,52 @@ class GmailParser(object):
             title = _utils.clean_string(i.find('a', class_="gse_alrt_title").text)
             print(f'Email {email["id"]}. Parsing "{title}"...')
 
-            # Build message object + add to list
-            extracted_citations.append(ExtractedCitation(email_id=email['id'],
-                                                         title=title,
-                                                         snippet=snippet_clean,
-                                                         author=parsed_bib_data['author'],
-                                                         pub_title=parsed_bib_data['pub_title'],
-                                                         pub_year=parsed_bib_data['pub_year'],
-                                                         sent_date=email['received_date'],
-                                                         source='GS',
-                                                         id_status=False,
-                                                         label_id=email['label'],
-                                                         snippet_match=snippet_match,
-                                                         highlight_length=snippet_distance
-                                                         ))
+            # Build message record + add to list
+            extracted_citations.append(dict(email_id=email['id'],
+                                            title=title,
+                                            snippet=snippet_clean,
+                                            author=parsed_bib_data['author'],
+                                            pub_title=parsed_bib_data['pub_title'],
+                                            pub_year=parsed_bib_data['pub_year'],
+                                            sent_date=email['received_date'],
+                                            source='GS',
+                                            id_status=False,
+                                            label_id=email['label'],
+                                            snippet_match=snippet_match,
+                                            highlight_length=snippet_distance
+                                            ))
 
         return extracted_citations
 
+    @classmethod
+    def _make_soup(cls, body):
+        try:
+            return bs4.BeautifulSoup(body, cls.html_parser)
+        except bs4.FeatureNotFound:
+            _utils.logger.warning(f'{cls.html_parser} parser not available; using html.parser.')
+            cls.html_parser = 'html.parser'
+            return bs4.BeautifulSoup(body, cls.html_parser)
+
+    @staticmethod
+    def _is_citation_tag(tag):
+        return tag.name == 'h3' or 'gse_alrt_sni' in tag.get('class', [])
+
+    @classmethod
+    def _find_citations(cls, soup):
+        """
+        Pairs each citation title (h3) with its snippet in a single walk through the document.
+        A title without a snippet before the next title is paired with None.
+        :param soup: the parsed email
+        :return: list of (h3 tag, snippet tag or None) tuples
+        """
+        citations = []
+        for tag in soup.find_all(cls._is_citation_tag):
+            if tag.name == 'h3':
+                citations.append([tag, None])
+            elif citations and citations[-1][1] is None:
+                citations[-1][1] = tag
+        return [tuple(c) for c in citations]
+
     @classmethod
     def _parse_email_bib_data(cls, bib_data):
         """
@@ -205,19 +287,49 @@ class GmailParser(object):
             }
 
     def get_email(self, email_id):
+        return self._build_email(email_id, self._get_email_data(email_id))
+
+    def get_emails(self, email_ids, batch_size=50):
+        """
+        Retrieves several emails, grouping the message requests into Gmail batch requests. They
+        aren't marked as read; the harvester does that once their citations have been stored.
+        :param email_ids: list of email IDs
+        :param batch_size: maximum number of message requests in each batch request
+        :return: generator of email dicts in the same order as email_ids; emails that could not
+                 be retrieved are left out
+        """
+        email_data = {}
+
+        def _store_response(request_id, response, exception):
+            if exception is not None:
+                _utils.logger.error(
+                    f'An error occurred during full-text message retrieval: {exception}')
+            else:
+                email_data[request_id] = response
+
+        for i in range(0, len(email_ids), batch_size):
+            batch = self.service.new_batch_http_request(callback=_store_response)
+            for email_id in email_ids[i:i + batch_size]:
+                batch.add(self.service.users().messages().get(userId='me', id=email_id,
+                                                              format='full'),
+                          request_id=email_id)
+            batch.execute()
+
+            for email_id in email_ids[i:i + batch_size]:
+                if email_id in email_data:
+                    yield self._build_email(email_id, email_data.pop(email_id))
+
+    def _build_email(self, email_id, email_data):
         email = {
             'id': email_id,
             'harvested_date': date.today()
             }
-        email_data = self._get_email_data(email_id)
         email['label'] = self._get_email_label(email_data)
 
         email['received_date'] = date.fromtimestamp(
             int(email_data['internalDate']) / 1000).isoformat()
         encoded_body = email_data.get('payload', {}).get('body', {}).get('data', b'')
         email['body'] = base64.urlsafe_b64decode(encoded_body)
-        self._mark_emails_read([email_id])
-
         return email
 
     def _get_email_data(self, email_id):
@@ -238,8 +350,10 @@ class GmailParser(object):
                 break
         return label
 
-    def _mark_emails_read(self, email_ids):
-        self.service.users().messages().batchModify(userId='me', body={
-            'removeLabelIds': ['UNREAD'],
-            'ids': email_ids
-            }).execute()
+    def mark_emails_read(self, email_ids):
+        # batchModify accepts at most 1000 ids per request
+        for chunk in chunked(email_ids, 1000):
+            self.service.users().messages().batchModify(userId='me', body={
+                'removeLabelIds': ['UNREAD'],
+                'ids': chunk
+                }).execute()
@@ -1,2 +1,4 @@
 from .core import IdentifyCore
 from ._base import BaseIdentifier
+from .crossref import CrossRefIdentifier
+from .local import LocalIdentifier, TitleIndex
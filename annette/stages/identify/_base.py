@@ -1,5 +1,7 @@
 from abc import abstractmethod
 
+from annette.stages.classify.features import FeatureStore
+
 
 class BaseIdentifier(object):
     """
@@ -17,10 +19,20 @@ class BaseIdentifier(object):
         """
         pass
 
+    @abstractmethod
+    def process_data(self, messages):
+        """
+        Identify the extracted citations.
+        :param messages: list of ExtractedCitation instances
+        :return: list of new Citation instances
+        """
+        pass
+
     def store_citations(self, citations):
         """
-        Store the citations.
+        Store the citations, along with their features for the classifier.
         :return:
         """
         self.session_manager.session.add_all(citations)
         self.session_manager.session.flush()
+        FeatureStore(self.session_manager.session).update([c.doi for c in citations])
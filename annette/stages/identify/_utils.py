@@ -1,4 +1,74 @@
+import re
+import unicodedata
+from datetime import date
+
 from annette.utils.log import get_logger
 
 logger = get_logger('annette.identify')
 
+_words = re.compile(r'\w+')
+
+
+def partial_date(part_date):
+    """
+    Parses partial dates and fills in missing values
+    :param part_date:
+    :return: Date
+    """
+    if part_date[0][0] is None:
+        return None
+    elif len(part_date[0]) == 3:
+        return date(part_date[0][0], part_date[0][1], part_date[0][2])
+    elif len(part_date[0]) == 2:
+        return date(part_date[0][0], part_date[0][1], 1)
+    elif len(part_date[0]) == 1:
+        return date(part_date[0][0], 7, 1)
+    else:
+        return None
+
+
+def concatenate_authors(authors):
+    """
+    Concatenates author list
+    :param authors:
+    :return: String of authors, semicolon delimited
+    """
+    return "; ".join([", ".join((n.get('family', ''), n.get('given', ''))) for n in authors]) \
+        if authors is not None else None
+
+
+def normalise_title(title):
+    """
+    Reduces a title to a key for comparing it to other titles, ignoring differences in case,
+    accents, punctuation and whitespace (and between "&" and "and").
+    :param title: the title, or None
+    :return: string (empty if title is None)
+    """
+    if title is None:
+        return ''
+    title = title.casefold().replace('&', ' and ')
+    if not title.isascii():
+        title = unicodedata.normalize('NFKD', title)
+        title = ''.join(c for c in title if not unicodedata.combining(c))
+    return ' '.join(_words.findall(title))
+
+
+def could_match(title, other, min_length_ratio, min_shared_words):
+    """
+    A quick check on two normalised titles to rule out pairs that aren't worth scoring. This
+    also stops short titles (e.g. "Introduction") from matching any title containing them.
+    :param title: a normalised title
+    :param other: the normalised title to compare it to
+    :param min_length_ratio: the smallest fraction of the longer title's length the shorter
+                             one can be
+    :param min_shared_words: the smallest fraction of the shorter title's words that have to
+                             be in the longer one
+    :return: boolean
+    """
+    shorter, longer = sorted((title, other), key=len)
+    if not shorter or len(shorter) < len(longer) * min_length_ratio:
+        return False
+    words = shorter.split()
+    longer_words = set(longer.split())
+    shared = sum(1 for w in words if w in longer_words)
+    return shared >= len(words) * min_shared_words
@@ -1,15 +1,28 @@
 from ._utils import logger
 from ._base import BaseIdentifier
-# import other identifiers here
+from .crossref import CrossRefIdentifier
+from .local import LocalIdentifier
 
 
 class IdentifyCore:
-    identifiers = []  # list the identifier classes
+    # known citations are matched locally first, so they're not searched for
+    identifiers = [LocalIdentifier, CrossRefIdentifier]
 
     @classmethod
-    def run(cls):
-        # processing code here
-        return []
+    def run(cls, session_manager):
+        logger.debug('Beginning identify stage')
+        citations = {}
+        for identifier_type in cls.identifiers:
+            identifier = identifier_type(session_manager)
+            messages = identifier.get_data()
+            logger.debug(f'Running {identifier_type.__name__} for {len(messages)} extracted '
+                         f'citations.')
+            for citation in identifier.process_data(messages):
+                # if more than one identifier finds the same citation, keep the first
+                citations.setdefault(citation.doi, citation)
+        citations = session_manager.log(list(citations.values()))
+        logger.debug(f'Finished identifying. {len(citations)} new citations found.')
+        return citations
 
     @classmethod
     def store(cls, session_manager, citations):
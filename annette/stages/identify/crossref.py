@@ -0,0 +1,235 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from sqlalchemy import and_, or_
+
+from annette.db.models import Citation, ExtractedCitation
+from annette.utils.cache import response_cache
+from annette.utils.chunks import chunked
+from annette.utils.http import pooled_session
+from annette.utils.imports import lazy_import
+from annette.utils.rate import RateLimiter
+from ._base import BaseIdentifier
+from ._utils import concatenate_authors, could_match, logger, normalise_title, partial_date
+
+fuzz = lazy_import('rapidfuzz.fuzz')
+requests = lazy_import('requests')
+
+
+class CrossRefIdentifier(BaseIdentifier):
+    """
+    Identify extracted citations by searching CrossRef for their titles.
+    """
+    base_url = 'https://api.crossref.org/works'
+    # identifying ourselves gets us into CrossRef's "polite" pool
+    mail_to = 's.vincent@nhm.ac.uk'
+    fields = ['DOI', 'title', 'author', 'type', 'subject', 'container-title', 'publisher',
+              'issue', 'volume', 'page', 'ISSN', 'ISBN', 'published-online', 'issued', 'link']
+    # how long before an extracted citation that couldn't be identified is searched for again;
+    # this doubles after each unsuccessful search, up to max_refresh_interval
+    refresh_interval = timedelta(days=31)
+    max_refresh_interval = timedelta(days=365)
+    cache_ttl = timedelta(weeks=4)
+    # CrossRef allows 50 requests a second; stay well within that
+    rate_limit = 10
+    workers = 8
+    # the number of results to request for each search; the best matching one is used
+    candidates = 5
+    # how similar (out of 100) a result's title has to be to the extracted one to be a match
+    min_score = 90
+    # results are ruled out before scoring if the shorter (normalised) title is less than this
+    # fraction of the longer one's length, or shares less than this fraction of its words
+    min_length_ratio = 0.5
+    min_shared_words = 0.5
+
+    def __init__(self, session_manager):
+        super(CrossRefIdentifier, self).__init__(session_manager)
+        self.rate_limiter = RateLimiter(self.rate_limit)
+        self.http = pooled_session(self.workers)
+        self.cache = response_cache()
+
+    def get_data(self):
+        """
+        Load the extracted citations that haven't been identified yet and are due to be searched
+        for again (see back_off).
+        :return: list of ExtractedCitation instances
+        """
+        return self.session_manager.session.query(ExtractedCitation).filter(
+            ExtractedCitation.doi.is_(None), self.due(date.today())).all()
+
+    @classmethod
+    def due(cls, today):
+        """
+        A filter for the extracted citations that are due to be searched for (see back_off).
+        :param today: the date to check against
+        :return: SQLAlchemy clause
+        """
+        return or_(ExtractedCitation.next_identify_run <= today,
+                   # never searched for, or last searched before back-off was added
+                   and_(ExtractedCitation.next_identify_run.is_(None),
+                        or_(ExtractedCitation.last_identify_run.is_(None),
+                            ExtractedCitation.last_identify_run <=
+                            today - cls.refresh_interval)))
+
+    def process_data(self, messages):
+        """
+        Search CrossRef for each of the extracted citations. The same paper is often extracted
+        from several alerts, so the citations are grouped first and each group is only searched
+        for once. The searches are run from a pool of worker threads (while keeping to the rate
+        limit) so their latency overlaps, but the results are matched one by one in this thread.
+        :param messages: list of ExtractedCitation instances
+        :return: list of new Citation instances
+        """
+        today = date.today()
+        matches = {}
+        groups = list(self.group_messages(messages).values())
+        # the workers get plain values rather than the instances, so they never load anything
+        # through the (not thread safe) session
+        queries = [(group[0].title, group[0].pub_title, group[0].pub_year) for group in groups]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [(group, executor.submit(self.search, *query)) for group, query in
+                       zip(groups, queries)]
+            for group, future in futures:
+                try:
+                    results = future.result()
+                except (requests.RequestException, ValueError, KeyError) as error:
+                    # the request failed or the response wasn't what we expected (e.g. not JSON);
+                    # leave them to be tried again next time
+                    logger.warning(f'CrossRef search failed for {group[0].id}: {error}')
+                    continue
+                for message in group:
+                    self.back_off(message, today)
+                best_match = self.pick_match(group[0], results)
+                if best_match is None:
+                    continue
+                doi = best_match.get('DOI')
+                for message in group:
+                    if doi is None:
+                        message.id_status = True
+                    else:
+                        message.doi = doi
+                if doi is not None:
+                    matches.setdefault(doi, (group[0], best_match))
+
+        known = self.known_dois(list(matches))
+        citations = [self.build_citation(message, best_match) for doi, (message, best_match) in
+                     matches.items() if doi not in known]
+        logger.debug(f'{len(groups)} searches for {len(messages)} extracted citations; '
+                     f'{len(matches)} identified, {len(citations)} new citations.')
+        return citations
+
+    def back_off(self, message, today):
+        """
+        Records that the extracted citation has been searched for, and sets when it should next
+        be searched for if it wasn't identified: refresh_interval after the first search,
+        doubling each time up to max_refresh_interval.
+        """
+        message.last_identify_run = today
+        message.identify_attempts = (message.identify_attempts or 0) + 1
+        interval = min(self.refresh_interval * 2 ** (message.identify_attempts - 1),
+                       self.max_refresh_interval)
+        message.next_identify_run = today + interval
+
+    @staticmethod
+    def group_messages(messages):
+        """
+        Groups extracted citations that would be searched for with the same (normalised) title,
+        publication title and year.
+        :param messages: list of ExtractedCitation instances
+        :return: dict of key -> list of ExtractedCitation instances, in the order first seen
+        """
+        groups = {}
+        for message in messages:
+            key = (normalise_title(message.title), normalise_title(message.pub_title),
+                   message.pub_year)
+            groups.setdefault(key, []).append(message)
+        return groups
+
+    def search(self, title, pub_title, pub_year):
+        """
+        Search CrossRef for an extracted citation (via the response cache). This is run in
+        worker threads, so it's given the citation's values rather than the instance.
+        :param title: the extracted citation's title
+        :param pub_title: the extracted citation's publication title, or None
+        :param pub_year: the extracted citation's publication year, or None
+        :return: list of dicts of metadata for the results (up to candidates of them)
+        """
+        query = title if pub_title is None else f'{title} {pub_title}'
+        pub_date = '1990-01-01' if pub_year is None else f'{pub_year}-01-01'
+
+        def _get():
+            self.rate_limiter.acquire()
+            r = self.http.get(self.base_url, params={
+                'query': query,
+                'filter': f'from-pub-date:{pub_date}',
+                'rows': self.candidates,
+                'select': ','.join(self.fields),
+                'mailto': self.mail_to
+                })
+            r.raise_for_status()
+            # only the results are cached, so a malformed response raises here and isn't
+            return r.json()['message']['items']
+
+        return self.cache.lookup('crossref', json.dumps([query, pub_date, self.candidates]), _get,
+                                 self.cache_ttl)
+
+    def pick_match(self, message, results):
+        """
+        Compare the extracted citation's title to the titles of the search results, after
+        normalising them all.
+        :param message: ExtractedCitation
+        :param results: list of dicts of metadata for the search results
+        :return: the best matching result, or None if none of them are close enough
+        """
+        title = normalise_title(message.title)
+        best_match = None
+        best_score = 0
+        for result in results:
+            result_title = normalise_title(result['title'][0]) if result.get('title') else ''
+            if not self.could_match(title, result_title):
+                continue
+            score = fuzz.partial_ratio(title, result_title, score_cutoff=self.min_score)
+            # if scores are tied, the result CrossRef ranked higher wins
+            if score > best_score:
+                best_match = result
+                best_score = score
+        return best_match
+
+    def could_match(self, title, other):
+        """
+        Rule out pairs of (normalised) titles that aren't worth scoring; see _utils.could_match.
+        :return: boolean
+        """
+        return could_match(title, other, self.min_length_ratio, self.min_shared_words)
+
+    def known_dois(self, dois):
+        """
+        :return: the set of DOIs (out of the given ones) that are already in the citations table
+        """
+        known = set()
+        for chunk in chunked(dois):
+            q = self.session_manager.session.query(Citation.doi).filter(Citation.doi.in_(chunk))
+            known.update(doi for doi, in q)
+        return known
+
+    @staticmethod
+    def build_citation(message, best_match):
+        return Citation(author=concatenate_authors(best_match.get('author')),
+                        doi=best_match['DOI'],
+                        title=best_match['title'][0],
+                        type=best_match.get('type'),
+                        issued_date=partial_date(best_match['issued']['date-parts']) if
+                        'issued' in best_match else None,
+                        subject=','.join(best_match['subject']) if 'subject' in best_match else
+                        None,
+                        pub_title=best_match['container-title'][0] if best_match.get(
+                            'container-title') else None,
+                        pub_publisher=best_match.get('publisher'),
+                        issn=best_match['ISSN'][0] if 'ISSN' in best_match else None,
+                        isbn=best_match['ISBN'][0] if 'ISBN' in best_match else None,
+                        issue=best_match.get('issue'),
+                        volume=best_match.get('volume'),
+                        page=best_match.get('page'),
+                        classification_id=None,
+                        ecid=message.id)
@@ -0,0 +1,168 @@
+import zlib
+from collections import defaultdict
+from datetime import date
+
+from sqlalchemy import bindparam
+
+from annette.db.models import Citation, ExtractedCitation
+from annette.utils.imports import lazy_import
+from ._base import BaseIdentifier
+from ._utils import could_match, logger, normalise_title
+from .crossref import CrossRefIdentifier
+
+fuzz = lazy_import('rapidfuzz.fuzz')
+np = lazy_import('numpy')
+
+# a Mersenne prime for the MinHash permutations. It's smaller than the largest crc32 hashes, so
+# n-grams whose hashes differ by a multiple of it collide, but that's rare (and only makes the
+# signatures slightly less exact); with this size the arithmetic fits in 64 bits
+_prime = (1 << 31) - 1
+
+
+class TitleIndex(object):
+    """
+    An in-memory index of citation titles, for looking up the DOI of a title without searching
+    CrossRef. Exact matches (after normalising) are found in a dict. Near matches are found with
+    MinHash signatures of the titles' character n-grams, split into bands for locality
+    sensitive hashing, so that only titles that are likely to be similar get scored.
+    """
+    ngram = 3
+    permutations = 32
+    # with 8 bands of 4 rows, titles sharing about 60% of their n-grams will usually be compared
+    bands = 8
+    # how similar (out of 100) two titles have to be to be counted as the same
+    min_score = 90
+    # titles with fewer (normalised) words than this, e.g. "Editorial", aren't distinctive
+    # enough to be matched without a search
+    min_words = 4
+    # see _utils.could_match
+    min_length_ratio = 0.8
+    min_shared_words = 0.5
+
+    def __init__(self):
+        self._exact = {}
+        self._titles = []
+        self._buckets = defaultdict(list)
+        rng = np.random.RandomState(0)
+        self._a = rng.randint(1, _prime, size=(self.permutations, 1)).astype(np.uint64)
+        self._b = rng.randint(0, _prime, size=(self.permutations, 1)).astype(np.uint64)
+
+    @classmethod
+    def build(cls, session):
+        """
+        Index the titles of all the citations in the database.
+        :param session: the database session
+        :return: TitleIndex
+        """
+        index = cls()
+        for doi, title, issued_date in session.query(Citation.doi, Citation.title,
+                                                     Citation.issued_date):
+            index.add(doi, title, issued_date.year if issued_date is not None else None)
+        logger.debug(f'Indexed {len(index)} citation titles.')
+        return index
+
+    def __len__(self):
+        return len(self._titles)
+
+    def add(self, doi, title, year=None):
+        """
+        :param doi: the citation's DOI
+        :param title: the citation's title
+        :param year: the year the citation was published, if known
+        """
+        key = normalise_title(title)
+        if len(key.split()) < self.min_words:
+            return
+        self._exact.setdefault(key, []).append((doi, year))
+        for band in self._bands(key):
+            self._buckets[band].append(len(self._titles))
+        self._titles.append((key, doi, year))
+
+    def lookup(self, title, year=None):
+        """
+        Find the DOI of the indexed title that matches the given one, if there is one. Near
+        matches have to have the same number of words, so e.g. "Correction to: <title>" or
+        "<title> part II" don't match <title>. If both titles have a year, the years have to be
+        the same.
+        :param title: the title to look for
+        :param year: the year it was published, if known
+        :return: the DOI, or None
+        """
+        key = normalise_title(title)
+        n_words = len(key.split())
+        if n_words < self.min_words:
+            return None
+        for doi, other_year in self._exact.get(key, []):
+            if self._same_year(year, other_year):
+                return doi
+        candidates = {i for band in self._bands(key) for i in self._buckets.get(band, ())}
+        best_doi = None
+        best_score = 0
+        for i in sorted(candidates):
+            other, doi, other_year = self._titles[i]
+            if len(other.split()) != n_words or not self._same_year(year, other_year) or \
+                    not could_match(key, other, self.min_length_ratio, self.min_shared_words):
+                continue
+            score = fuzz.ratio(key, other, score_cutoff=self.min_score)
+            if score > best_score:
+                best_doi = doi
+                best_score = score
+        return best_doi
+
+    @staticmethod
+    def _same_year(year, other_year):
+        return year is None or other_year is None or year == other_year
+
+    def _bands(self, key):
+        """
+        :return: a hashable key for each band of the title's MinHash signature
+        """
+        n = min(self.ngram, len(key))
+        shingles = {key[i:i + n] for i in range(len(key) - n + 1)}
+        hashes = np.fromiter((zlib.crc32(s.encode()) for s in shingles), dtype=np.uint64,
+                             count=len(shingles))
+        signature = ((self._a * hashes + self._b) % _prime).min(axis=1)
+        return [(i, band.tobytes()) for i, band in
+                enumerate(signature.reshape(self.bands, -1))]
+
+
+class LocalIdentifier(BaseIdentifier):
+    """
+    Identify extracted citations that are already in the citations table by their titles, so
+    repeat sightings of a paper don't need to be searched for.
+    """
+
+    def get_data(self):
+        """
+        Load the extracted citations that haven't been identified yet and are due to be searched
+        for (i.e. new ones, and ones whose back-off has run out), so they're only searched for if
+        they don't match a known citation. Only the columns needed for matching are loaded.
+        :return: list of (id, title, pub_year) rows
+        """
+        return self.session_manager.session.query(
+            ExtractedCitation.id, ExtractedCitation.title, ExtractedCitation.pub_year).filter(
+            ExtractedCitation.doi.is_(None), CrossRefIdentifier.due(date.today())).all()
+
+    def process_data(self, messages):
+        """
+        Look up each of the extracted citations' titles in the index of known citations, and set
+        the DOIs of the ones that match with a single UPDATE.
+        :param messages: list of (id, title, pub_year) rows, as returned by get_data
+        :return: an empty list, as anything identified is already a citation
+        """
+        if not messages:
+            return []
+        index = TitleIndex.build(self.session_manager.session)
+        today = date.today()
+        identified = []
+        for message in messages:
+            doi = index.lookup(message.title, message.pub_year)
+            if doi is not None:
+                identified.append({'_id': message.id, 'doi': doi, 'last_identify_run': today})
+        if identified:
+            table = ExtractedCitation.__table__
+            self.session_manager.session.execute(
+                table.update().where(table.c.id == bindparam('_id')), identified)
+        logger.debug(f'{len(identified)}/{len(messages)} extracted citations matched known '
+                     f'citations.')
+        return []
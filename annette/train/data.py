@@ -2,6 +2,7 @@ from sqlalchemy import func, not_
 
 from annette.db import SessionManager
 from annette.db.models import Citation, ManualClassification
+from annette.stages.classify.features import FeatureStore
 
 
 def get_data(attr_name):
@@ -41,3 +42,17 @@ def get_multi_data(attr_names):
         data.append(citation)
 
     return data
+
+
+def get_features():
+    """
+    Load the classifier's features (the same ones used by the classify stage) for the manually
+    classified citations.
+    :return: DataFrame with the doi, the feature columns and the class
+    """
+    with SessionManager() as session_manager:
+        classes = dict(session_manager.session.query(ManualClassification.doi,
+                                                     ManualClassification.classification_id))
+        features = FeatureStore(session_manager.session).read(list(classes))
+    features['class'] = features.doi.map(classes)
+    return features
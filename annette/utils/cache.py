@@ -0,0 +1,159 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from .log import get_logger
+
+logger = get_logger('annette.cache')
+
+
+class ResponseCache(object):
+    """
+    A persistent cache for responses from external APIs, stored in an SQLite database so that
+    lookups made in one run (e.g. for a DOI or a name) don't have to be repeated in the next.
+    Entries are grouped by source (e.g. 'dimensions'), each with its own time to live, and the
+    least recently used entries are removed once there are more than max_entries.
+
+    If path is None the cache is disabled: every lookup is a miss and nothing is stored.
+    """
+
+    def __init__(self, path, max_entries=100000):
+        """
+        :param path: path to the SQLite database file, or None to disable caching
+        :param max_entries: the maximum number of entries to keep across all sources
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = Counter()
+        self.misses = Counter()
+        self._lock = threading.Lock()
+        self._connection = None
+        self._size = 0
+        if path is not None:
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+            self._connection.execute('CREATE TABLE IF NOT EXISTS responses (source TEXT, key TEXT, '
+                                     'value TEXT, stored REAL, accessed REAL, '
+                                     'PRIMARY KEY (source, key))')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS responses_accessed '
+                                     'ON responses (accessed)')
+            self._connection.commit()
+            self._size = self._connection.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    @property
+    def enabled(self):
+        return self._connection is not None
+
+    def lookup(self, source, key, fetch, ttl):
+        """
+        Returns the cached response for the key if there is one that's less than ttl old;
+        otherwise calls fetch and caches what it returns (which must be JSON serialisable; None
+        is cached too, e.g. for "not found"). Exceptions raised by fetch are not cached.
+        :param source: name of the API the response is from
+        :param key: identifies the request within the source, e.g. a URL or a DOI
+        :param fetch: function taking no arguments that makes the actual request
+        :param ttl: how long the response can be used for, as a timedelta
+        :return: the cached or fetched response
+        """
+        found, value = self._get(source, key, ttl)
+        if found:
+            return value
+        value = fetch()
+        if self.enabled:
+            self._store(source, key, value)
+        return value
+
+    def lookup_many(self, source, keys, fetch, ttl):
+        """
+        Like lookup, but for several keys at once; fetch is called once with all the keys that
+        weren't found in the cache (if there are any).
+        :param fetch: function taking a list of keys and returning a dict of key -> response;
+                      keys missing from the dict are cached as None
+        :return: dict of key -> response for every key
+        """
+        values = {}
+        missing = []
+        for key in keys:
+            found, value = self._get(source, key, ttl)
+            if found:
+                values[key] = value
+            else:
+                missing.append(key)
+        if missing:
+            fetched = fetch(missing)
+            for key in missing:
+                values[key] = fetched.get(key)
+                if self.enabled:
+                    self._store(source, key, values[key])
+        return values
+
+    def _get(self, source, key, ttl):
+        """
+        :return: tuple of (whether the key was found, the cached response)
+        """
+        row = None
+        if self.enabled:
+            now = time.time()
+            with self._lock:
+                row = self._connection.execute(
+                    'SELECT value FROM responses WHERE source = ? AND key = ? AND stored > ?',
+                    (source, key, now - ttl.total_seconds())).fetchone()
+                if row is not None:
+                    self._connection.execute(
+                        'UPDATE responses SET accessed = ? WHERE source = ? AND key = ?',
+                        (now, source, key))
+                    self._connection.commit()
+        if row is None:
+            self.misses[source] += 1
+            return False, None
+        self.hits[source] += 1
+        return True, json.loads(row[0])
+
+    def _store(self, source, key, value):
+        now = time.time()
+        with self._lock:
+            cursor = self._connection.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+                (source, key, json.dumps(value), now, now))
+            self._size += cursor.rowcount
+            if self._size > self.max_entries:
+                self._evict()
+            self._connection.commit()
+
+    def _evict(self):
+        # remove the least recently used tenth in one go so this doesn't run on every insert
+        self._size = self._connection.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+        excess = self._size - self.max_entries + self.max_entries // 10
+        if excess > 0:
+            self._connection.execute('DELETE FROM responses WHERE rowid IN (SELECT rowid FROM '
+                                     'responses ORDER BY accessed LIMIT ?)', (excess,))
+            self._size -= excess
+
+    def stats(self):
+        """
+        :return: dict of source -> {'hits': number of hits, 'misses': number of misses}
+        """
+        return {source: {'hits': self.hits[source], 'misses': self.misses[source]} for source in
+                sorted(set(self.hits) | set(self.misses))}
+
+    def log_stats(self):
+        for source, counts in self.stats().items():
+            logger.debug(f'Response cache for {source}: {counts["hits"]} hits, '
+                         f'{counts["misses"]} misses.')
+
+
+_cache = None
+
+
+def response_cache():
+    """
+    Gets the shared response cache, stored at the path in the RESPONSE_CACHE_PATH environment
+    variable (and disabled if that isn't set).
+    :return: ResponseCache
+    """
+    global _cache
+    if _cache is None:
+        _cache = ResponseCache(os.environ.get('RESPONSE_CACHE_PATH'))
+    return _cache
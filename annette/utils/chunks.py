@@ -0,0 +1,19 @@
+import itertools
+
+# the maximum number of values to put in one IN (...) list in a query
+in_list_size = 1000
+
+
+def chunked(iterable, size=in_list_size):
+    """
+    Splits an iterable into lists of (at most) the given size without loading it all at once.
+    :param iterable: any iterable, including generators
+    :param size: maximum length of each chunk
+    :return: generator of lists
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
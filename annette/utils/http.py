@@ -0,0 +1,18 @@
+from .imports import lazy_import
+
+requests = lazy_import('requests')
+
+
+def pooled_session(pool_size):
+    """
+    A requests session for sharing between worker threads, which keeps up to pool_size
+    connections to each host open so they're reused rather than making a new (TLS) connection
+    for every request.
+    :param pool_size: the number of connections to keep, i.e. the number of threads
+    :return: requests.Session
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
@@ -0,0 +1,30 @@
+import importlib
+
+
+class LazyModule(object):
+    """
+    Stands in for a module that's slow to import, only importing it when one of its attributes is
+    first used. Attributes are looked up on the real module every time, so patching them (e.g. in
+    tests) still works.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, item):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, item)
+
+    def __repr__(self):
+        return f'<lazy module {self._name}>'
+
+
+def lazy_import(name):
+    """
+    Defers importing a module until it's actually used.
+    :param name: the full name of the module, e.g. 'apiclient.discovery'
+    :return: a LazyModule
+    """
+    return LazyModule(name)
@@ -0,0 +1,39 @@
+import threading
+import time
+
+
+class RateLimiter(object):
+    """
+    A token bucket that can be shared between threads. Tokens are added at a steady rate up to
+    a maximum of burst, and each request takes one; if none are left the request waits for its
+    turn. This keeps requests under the rate limit without adding the limit's delay on top of
+    each request's own latency.
+    """
+
+    def __init__(self, rate, burst=1):
+        """
+        :param rate: the maximum average number of requests per second
+        :param burst: the maximum number of requests that can be made at once after a pause
+        """
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Takes a token, blocking until one is available.
+        :return: the number of seconds spent waiting
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # reserve a token now even if it doesn't exist yet, so waiting threads queue up in
+            # order rather than all waking at once
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
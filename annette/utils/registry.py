@@ -0,0 +1,104 @@
+import hashlib
+import os
+import threading
+from collections import namedtuple
+
+from .imports import lazy_import
+from .log import get_logger
+
+joblib = lazy_import('joblib')
+pickle = lazy_import('dill')
+
+logger = get_logger('annette.registry')
+
+_Entry = namedtuple('_Entry', ['stat', 'digest', 'model'])
+
+
+class ModelRegistry(object):
+    """
+    Keeps models loaded from pickle files for the life of the process, so a long-running worker
+    only unpickles each one once. The file is checked on every get: a model is only loaded
+    again if the file's modification time/size have changed and its contents hash differently.
+
+    If mmap_dir is set, a joblib copy of each model is written there the first time it's loaded
+    and then memory-mapped (read only), so that large numpy arrays held directly by the model
+    are paged in as needed and shared between processes. This doesn't help scikit-learn's tree
+    models (including the random forest): their trees copy the node arrays into their own
+    buffers when they're loaded, so it's off unless asked for.
+    """
+
+    def __init__(self, mmap_dir=None):
+        """
+        :param mmap_dir: directory for memory-mappable copies of the models, or None to load
+                         them straight from the pickle files
+        """
+        self.mmap_dir = mmap_dir
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        """
+        Get the model pickled in the file at path, loading it if it hasn't been loaded yet or
+        the file has changed.
+        :param path: path to the pickle file
+        :return: the unpickled model
+        """
+        with self._lock:
+            stat = os.stat(path)
+            stat = (stat.st_mtime_ns, stat.st_size)
+            entry = self._models.get(path)
+            if entry is not None and entry.stat == stat:
+                return entry.model
+            digest = self._hash(path)
+            if entry is not None and entry.digest == digest:
+                # touched but not changed
+                self._models[path] = entry._replace(stat=stat)
+                return entry.model
+            logger.debug(f'Loading model from {path}.')
+            model = self._load(path, digest)
+            self._models[path] = _Entry(stat, digest, model)
+            return model
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+
+    @staticmethod
+    def _hash(path):
+        sha1 = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha1.update(block)
+        return sha1.hexdigest()
+
+    def _load(self, path, digest):
+        if self.mmap_dir is None:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        # the hash is in the name so a changed model never uses an old copy
+        name = os.path.splitext(os.path.basename(path))[0]
+        mmap_path = os.path.join(self.mmap_dir, f'{name}.{digest}.joblib')
+        if not os.path.exists(mmap_path):
+            with open(path, 'rb') as f:
+                model = pickle.load(f)
+            os.makedirs(self.mmap_dir, exist_ok=True)
+            # write to a temporary file first so other processes never see a partial copy
+            temp_path = f'{mmap_path}.{os.getpid()}.tmp'
+            joblib.dump(model, temp_path)
+            os.replace(temp_path, mmap_path)
+        return joblib.load(mmap_path, mmap_mode='r')
+
+
+_registry = None
+
+
+def model_registry():
+    """
+    Gets the shared model registry, memory-mapping models from the directory in the
+    MODEL_MMAP_DIR environment variable (if it's set).
+    :return: ModelRegistry
+    """
+    global _registry
+    if _registry is None:
+        _registry = ModelRegistry(os.environ.get('MODEL_MMAP_DIR'))
+    return _registry
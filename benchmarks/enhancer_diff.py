@@ -0,0 +1,86 @@
+"""
+Compares finding and storing changed Dimensions metrics through the ORM (loading every existing
+entry as an instance and comparing each field as a string, as the enhancers used to) with the
+column-wise diff and bulk UPDATE in BaseEnhancer. Uses the test database and drops everything in
+it afterwards. Run from the repository root:
+
+    python -m benchmarks.enhancer_diff
+"""
+import os
+import time
+
+import mock
+
+from annette.db import SessionManager
+from annette.db.models import Citation, Metrics
+from annette.stages.enhance.dimensions import DimensionsEnhancer
+from annette.utils.chunks import chunked
+from tests import data
+
+N_ROWS = 50000
+# one in this many entries has changed since the last run
+CHANGED_EVERY = 10
+
+
+def setup(session_manager):
+    citation = data.citation().get_values()
+    metrics = data.metrics().get_values()
+    del metrics['id']
+    dois = [f'10.1000/benchmark-{i:06d}' for i in range(N_ROWS)]
+    session_manager.session.execute(Citation.__table__.insert(),
+                                    [dict(citation, doi=doi, ecid=None) for doi in dois])
+    session_manager.session.execute(Metrics.__table__.insert(),
+                                    [dict(metrics, doi=doi, times_cited=1) for doi in dois])
+    fields = ['times_cited', 'recent_citations', 'relative_citation_ratio',
+              'field_citation_ratio']
+    return [dict({k: metrics[k] for k in fields}, doi=doi,
+                 times_cited=2 if i % CHANGED_EVERY == 0 else 1) for i, doi in enumerate(dois)]
+
+
+def previous(enhancer, fetched):
+    session = enhancer.session
+    dois = [v['doi'] for v in fetched]
+    rows = {}
+    for chunk in chunked(dois):
+        for row in session.query(Metrics).filter(Metrics.doi.in_(chunk)):
+            rows.setdefault(row.doi, row)
+    metadata = []
+    for row_values in fetched:
+        row = rows[row_values['doi']]
+        changed = False
+        for k, v in row_values.items():
+            if str(getattr(row, k)) == str(v):
+                continue
+            setattr(row, k, v)
+            changed = True
+        if changed:
+            metadata.append(row)
+    session.add_all(metadata)
+    session.flush()
+    return len(metadata)
+
+
+def current(enhancer, fetched):
+    new, changed = enhancer.diff_metadata(fetched)
+    with enhancer.session.begin():
+        enhancer.update_metadata(Metrics, changed)
+    return len(changed)
+
+
+if __name__ == '__main__':
+    with mock.patch('annette.db.session.SessionManager.database_url',
+                    os.environ.get('TEST_DATABASE_URL')):
+        sm = SessionManager()
+    for name, run in [('orm', previous), ('bulk', current)]:
+        sm.drop()
+        with sm:
+            fetched = setup(sm)
+            enhancer = DimensionsEnhancer(sm)
+            start = time.perf_counter()
+            n_changed = run(enhancer, fetched)
+            elapsed = time.perf_counter() - start
+            sm.session.expire_all()
+            assert sm.session.query(Metrics).filter(Metrics.times_cited == 2).count() == n_changed
+            print(f'{name:>5}: {elapsed:6.2f}s for {N_ROWS} rows ({n_changed} changed), '
+                  f'{N_ROWS / elapsed:8.0f} rows/s')
+    sm.drop()
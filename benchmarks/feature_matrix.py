@@ -0,0 +1,70 @@
+"""
+Compares building the classifier's features from 100k extracted citation rows with the previous
+pandas approach (get_dummies on the label ids, then groupby/agg) against FeatureStore.aggregate,
+which fills a preallocated float32 matrix. Reports the time and the peak memory allocated.
+Run from the repository root:
+
+    python -m benchmarks.feature_matrix
+"""
+import random
+import timeit
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from annette.stages.classify.features import FeatureStore
+
+N_ROWS = 100000
+N_DOIS = 30000
+LABELS = FeatureStore.labels + ['Label_6', 'Label_7', None]
+
+
+def make_rows():
+    random.seed(1)
+    rows = []
+    for _ in range(N_ROWS):
+        doi = f'10.1000/benchmark-{random.randrange(N_DOIS):06d}'
+        rows.append((doi, random.randint(0, 1), random.randint(0, 20),
+                     random.choice([None, random.randint(0, 200)]), random.choice(LABELS)))
+    return rows
+
+
+def previous(rows):
+    # this read the rows into a DataFrame (with read_sql) first
+    df = pd.DataFrame.from_records(rows, columns=['doi', 'nhm_sub', 'snippet_match',
+                                                  'highlight_length', 'label_id'])
+    df = df.drop_duplicates()
+    expanded_labels = pd.get_dummies(df, columns=['label_id'], prefix='L')
+    aggregations = {'nhm_sub': 'max', 'snippet_match': 'mean', 'highlight_length': 'mean'}
+    aggregations.update({f'L_{label}': 'max' for label in FeatureStore.labels})
+    grouped_data = expanded_labels.groupby(['doi']).agg(aggregations).reset_index()
+    grouped_data = grouped_data.fillna(0)
+    return grouped_data.doi.values, grouped_data.iloc[:, 1:].values
+
+
+def current(rows):
+    return FeatureStore.aggregate(rows)
+
+
+def peak_memory(run):
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+if __name__ == '__main__':
+    rows = make_rows()
+    previous_dois, previous_matrix = previous(rows)
+    current_dois, current_matrix = current(rows)
+    assert list(previous_dois) == list(current_dois)
+    assert np.allclose(previous_matrix.astype(float), current_matrix, rtol=1e-6)
+
+    for name, run in [('pandas', lambda: previous(rows)), ('numpy', lambda: current(rows))]:
+        elapsed = min(timeit.repeat(run, number=1, repeat=5))
+        peak = peak_memory(run)
+        print(f'{name:>6}: {elapsed * 1000:7.1f}ms, peak {peak / 2 ** 20:6.1f}MiB for {N_ROWS} rows')
+    print(f'feature matrix: {previous_matrix.dtype} {previous_matrix.nbytes / 2 ** 20:.1f}MiB '
+          f'vs {current_matrix.dtype} {current_matrix.nbytes / 2 ** 20:.1f}MiB')
@@ -0,0 +1,39 @@
+"""
+Compares serial and batched Gmail message retrieval against a fake service with simulated
+network latency. Run from the repository root:
+
+    python -m benchmarks.gmail_fetch
+"""
+import time
+
+from annette.stages.harvest.gmail import GmailParser
+from tests.harvest._fakes import FakeGmailService
+
+N_EMAILS = 500
+LATENCY = 0.01
+
+
+def serial(email_ids):
+    service = FakeGmailService(latency=LATENCY)
+    parser = GmailParser(service)
+    for email_id in email_ids:
+        parser.get_email(email_id)
+    return service
+
+
+def batched(email_ids, batch_size):
+    service = FakeGmailService(latency=LATENCY)
+    list(GmailParser(service).get_emails(email_ids, batch_size=batch_size))
+    return service
+
+
+if __name__ == '__main__':
+    email_ids = [f'email_{i}' for i in range(N_EMAILS)]
+    runs = [('serial', lambda: serial(email_ids))] + [
+        (f'batch_size={n}', lambda n=n: batched(email_ids, n)) for n in (10, 50, 100)]
+    for name, run in runs:
+        start = time.perf_counter()
+        service = run()
+        elapsed = time.perf_counter() - start
+        print(f'{name:>15}: {service.round_trips:5d} round trips, {elapsed:6.2f}s, '
+              f'{N_EMAILS / elapsed:8.1f} emails/s')
@@ -0,0 +1,62 @@
+"""
+Compares the current minimum_word_distance with the previous implementation, which took the
+product of every phrase word's positions. Run from the repository root:
+
+    python -m benchmarks.minimum_word_distance
+"""
+import itertools
+import re
+import timeit
+
+import nltk
+
+from annette.stages.harvest import _utils
+
+snippets = [
+    'Page 1. American Journal of Botany 105(7): 1–13, 2018; http://www.wileyonlinelibrary. '
+    'com/journal/AJB © 2018 Botanical Society of America • 1 Crop wild relatives (CWRs) are '
+    'likely to play a significant role in securing 21st century',
+    'specimens used from: The Natural History Museum, London',
+    '… of specimens in the Natural History Museum (London), the Muséum national d\'Histoire '
+    'naturelle (Paris) and the Naturalis Biodiversity Center …',
+    '… holotype NHMUK 2019.123, deposited in the collections of the BM(NH) …',
+    '… the natural history of the region, as recorded by natural history societies and '
+    'natural history museums across Europe, with a history of the museum in London and the '
+    'natural history collections of the Natural History Museum, London …',
+    ]
+# a long snippet with many repeated phrase words, where the old implementation is slowest
+snippets.append(' '.join(snippets[-1:] * 6))
+
+
+def previous_minimum_word_distance(string):
+    single_tokens = ["nhmuk", "nhml", "bmnh", "10.5519"]
+    phrase_tokens = [('bm', 'nh'),
+                     ('natural', 'history', 'museum', 'london')]
+
+    tokens = [t.lower() for t in nltk.word_tokenize(string) if re.match(r'.*\w.*', t)]
+    for label in single_tokens:
+        if label in tokens:
+            return 0
+    min_distance = None
+    for phrase in phrase_tokens:
+        if not all([p in tokens for p in phrase]):
+            continue
+        indices = [[i for i, t in enumerate(tokens) if t == p] for p in phrase]
+        phrase_min_distance = min([max(x) - min(x) for x in itertools.product(*indices)])
+        phrase_min_distance -= len(phrase) - 1
+        if min_distance is None:
+            min_distance = phrase_min_distance
+        else:
+            min_distance = min(min_distance, phrase_min_distance)
+    return min_distance
+
+
+if __name__ == '__main__':
+    for i, snippet in enumerate(snippets):
+        assert previous_minimum_word_distance(snippet) == _utils.minimum_word_distance(snippet)
+        previous = min(timeit.repeat(lambda: previous_minimum_word_distance(snippet),
+                                     number=20, repeat=3)) / 20
+        current = min(timeit.repeat(lambda: _utils.minimum_word_distance(snippet),
+                                    number=20, repeat=3)) / 20
+        print(f'snippet {i} ({len(snippet):5d} chars): previous {previous * 1e6:9.1f}us, '
+              f'current {current * 1e6:9.1f}us, {previous / current:6.1f}x')
@@ -0,0 +1,65 @@
+"""
+Compares building and walking the email tree in GmailParser with the lxml and html.parser
+backends against the previous approach (html.parser plus a find_next search for each title),
+using the saved email fixtures. Run from the repository root:
+
+    python -m benchmarks.parse_email
+"""
+import contextlib
+import io
+import timeit
+
+from bs4 import BeautifulSoup
+
+from annette.stages.harvest.gmail import GmailParser
+from tests.harvest import _constants as constants
+
+# a typical alert has around 10-20 results; repeat the fixture's citations to get one that size
+_body = constants.multi_citation_email['body'].decode()
+_results = _body[_body.index('<body>') + 6:_body.index('</body>')]
+large_email = dict(constants.multi_citation_email, id='large',
+                   body=f'<html><body>{_results * 10}</body></html>'.encode())
+
+
+def previous_pairing(email):
+    soup = BeautifulSoup(email['body'], 'html.parser')
+    return [(i, i.find_next_sibling('div'), i.find_next(class_='gse_alrt_sni')) for i in
+            soup('h3')]
+
+
+def current_pairing(parser):
+    def _pair(email):
+        GmailParser.html_parser = parser
+        soup = GmailParser._make_soup(email['body'])
+        return [(i, i.find_next_sibling('div'), snippet) for i, snippet in
+                GmailParser._find_citations(soup)]
+
+    return _pair
+
+
+def current_parse_email(parser):
+    def _parse(email):
+        GmailParser.html_parser = parser
+        return GmailParser.parse_email(email)
+
+    return _parse
+
+
+def time_runs(runs, emails):
+    for name, run in runs:
+        # parse_email prints a line per citation; keep it out of the results
+        with contextlib.redirect_stdout(io.StringIO()):
+            elapsed = min(timeit.repeat(lambda: [run(e) for e in emails], number=20,
+                                        repeat=3)) / 20
+        print(f'{name:>24}: {elapsed * 1000:7.2f}ms for {len(emails)} emails')
+
+
+if __name__ == '__main__':
+    emails = constants.email_list + [large_email]
+    print('Building the tree and pairing titles, bib data and snippets:')
+    time_runs([('previous (html.parser)', previous_pairing),
+               ('lxml', current_pairing('lxml')),
+               ('html.parser', current_pairing('html.parser'))], emails)
+    print('Full parse_email, including string cleaning:')
+    time_runs([('lxml', current_parse_email('lxml')),
+               ('html.parser', current_parse_email('html.parser'))], emails)
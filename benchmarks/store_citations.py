@@ -0,0 +1,42 @@
+"""
+Compares storing extracted citations through the ORM (add_all + flush, as harvesters used to)
+with the bulk insert path in BaseHarvester.store_citations. Uses the test database and drops
+everything in it afterwards. Run from the repository root:
+
+    python -m benchmarks.store_citations
+"""
+import os
+import time
+
+import mock
+
+from annette.db import SessionManager
+from annette.stages.harvest import BaseHarvester
+from tests import data
+
+N_CITATIONS = 10000
+
+
+def orm(session_manager, citations):
+    session_manager.session.add_all(citations)
+    session_manager.session.flush()
+
+
+def bulk(session_manager, citations):
+    BaseHarvester(session_manager).store_citations(citations)
+
+
+if __name__ == '__main__':
+    with mock.patch('annette.db.session.SessionManager.database_url',
+                    os.environ.get('TEST_DATABASE_URL')):
+        sm = SessionManager()
+    for name, store in [('orm', orm), ('bulk', bulk)]:
+        sm.drop()
+        with sm:
+            citations = [data.extracted_citation(email_id=f'benchmark_{i}', log_id=sm.runlog.id)
+                         for i in range(N_CITATIONS)]
+            start = time.perf_counter()
+            store(sm, citations)
+            elapsed = time.perf_counter() - start
+            print(f'{name:>5}: {elapsed:6.2f}s, {N_CITATIONS / elapsed:8.0f} rows/s')
+    sm.drop()
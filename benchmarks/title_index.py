@@ -0,0 +1,58 @@
+"""
+Times building a TitleIndex and looking up exact, near (lightly changed) and unknown titles in
+it, using titles generated from a vocabulary of made-up words (a small vocabulary makes every
+title look alike, which real titles don't). Run from the repository root:
+
+    python -m benchmarks.title_index
+"""
+import random
+import time
+
+from annette.stages.identify import TitleIndex
+
+N_TITLES = 50000
+N_LOOKUPS = 1000
+N_WORDS = 10000
+STOP_WORDS = ('of', 'the', 'and', 'in', 'from', 'a', 'with', 'on', 'for')
+
+
+def make_vocabulary(rng):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    return [''.join(rng.choice(letters) for _ in range(rng.randint(3, 12))) for _ in
+            range(N_WORDS)]
+
+
+def near_variant(rng, title):
+    # changes that shouldn't stop a match (unlike added or removed words)
+    changes = [lambda t: t.upper(),
+               lambda t: t.replace(' ', ': ', 1) + '.',
+               lambda t: t[:len(t) // 2] + t[len(t) // 2 + 1:]]
+    return rng.choice(changes)(title)
+
+
+def random_title(rng, vocabulary):
+    return ' '.join(rng.choice(STOP_WORDS) if rng.random() < 0.3 else rng.choice(vocabulary)
+                    for _ in range(rng.randint(6, 16))).capitalize()
+
+
+if __name__ == '__main__':
+    rng = random.Random(0)
+    vocabulary = make_vocabulary(rng)
+    titles = [random_title(rng, vocabulary) for _ in range(N_TITLES)]
+    start = time.perf_counter()
+    index = TitleIndex()
+    for i, title in enumerate(titles):
+        index.add(f'doi-{i}', title)
+    print(f'built index of {N_TITLES} titles in {time.perf_counter() - start:.2f}s')
+
+    sample = rng.sample(range(N_TITLES), N_LOOKUPS)
+    lookups = [('exact', [(titles[i], f'doi-{i}') for i in sample]),
+               ('near', [(near_variant(rng, titles[i]), f'doi-{i}') for i in sample]),
+               ('unknown', [(random_title(rng, vocabulary), None) for _ in sample])]
+    for name, pairs in lookups:
+        start = time.perf_counter()
+        found = [index.lookup(title) for title, _ in pairs]
+        elapsed = time.perf_counter() - start
+        correct = sum(1 for doi, (_, expected) in zip(found, pairs) if doi == expected)
+        print(f'{name:>8}: {elapsed / N_LOOKUPS * 1e6:7.1f}us per lookup, '
+              f'{correct}/{N_LOOKUPS} as expected')
@@ -0,0 +1,100 @@
+"""
+Compares scoring CrossRef results against extracted titles with fuzzywuzzy's partial_ratio (as
+IdentifyCrossRef does) with CrossRefIdentifier.pick_match, which normalises the titles, rules
+out unlikely pairs with a cheap length/word check and scores the rest with rapidfuzz. Uses
+generated titles: each extracted title gets a few results, one of which is the same title with
+small changes (case, punctuation, a typo or a subtitle). Run from the repository root:
+
+    python -m benchmarks.title_matching
+"""
+import random
+import time
+
+from fuzzywuzzy import fuzz as fuzzywuzzy_fuzz
+
+from annette.stages.identify import CrossRefIdentifier
+
+N_TITLES = 1000
+N_RESULTS = 5
+
+WORDS = ('species', 'new', 'genus', 'phylogeny', 'museum', 'collections', 'natural', 'history',
+         'fossil', 'marine', 'insects', 'plants', 'evolution', 'diversity', 'morphology',
+         'revision', 'taxonomy', 'of', 'the', 'and', 'in', 'from', 'a', 'with', 'molecular',
+         'analysis', 'records', 'specimens', 'Cretaceous', 'Jurassic', 'beetles', 'moths',
+         'fishes', 'birds', 'mammals', 'Africa', 'Europe', 'Brazil', 'island', 'genomic',
+         'distribution', 'climate', 'change', 'ecology', 'population', 'description', 'review')
+
+
+def random_title(rng):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(6, 16))).capitalize()
+
+
+def variant(rng, title):
+    changes = [lambda t: t.upper(),
+               lambda t: t.replace(' ', ': ', 1) + '.',
+               lambda t: t + ' (' + rng.choice(WORDS) + ')',
+               lambda t: t[:len(t) // 2] + t[len(t) // 2 + 1:]]
+    return rng.choice(changes)(title)
+
+
+def make_cases(rng):
+    cases = []
+    for _ in range(N_TITLES):
+        title = random_title(rng)
+        results = [{'DOI': f'other-{i}', 'title': [random_title(rng)]} for i in
+                   range(N_RESULTS - 1)]
+        match = rng.randrange(N_RESULTS)
+        results.insert(match, {'DOI': 'match', 'title': [variant(rng, title)]})
+        cases.append((title, results))
+    return cases
+
+
+class Message:
+    def __init__(self, title):
+        self.title = title
+
+
+def previous(cases):
+    # only the top result was requested, so score that one
+    found = []
+    for title, results in cases:
+        top = results[0]
+        found.append(top['DOI'] if fuzzywuzzy_fuzz.partial_ratio(title, top['title'][0]) >= 90
+                     else None)
+    return found
+
+
+def previous_all(cases):
+    # the same scorer over every result, to separate the scoring cost from the extra results
+    found = []
+    for title, results in cases:
+        scores = [fuzzywuzzy_fuzz.partial_ratio(title, r['title'][0]) for r in results]
+        best = max(range(len(results)), key=lambda i: scores[i])
+        found.append(results[best]['DOI'] if scores[best] >= 90 else None)
+    return found
+
+
+def current(cases):
+    identifier = CrossRefIdentifier.__new__(CrossRefIdentifier)
+    found = []
+    for title, results in cases:
+        match = identifier.pick_match(Message(title), results)
+        found.append(match['DOI'] if match else None)
+    return found
+
+
+if __name__ == '__main__':
+    cases = make_cases(random.Random(0))
+    n_pairs = N_TITLES * N_RESULTS
+    for name, run, pairs in [('previous (top result)', previous, N_TITLES),
+                             ('previous (all results)', previous_all, n_pairs),
+                             ('current', current, n_pairs)]:
+        run(cases[:10])
+        start = time.perf_counter()
+        found = run(cases)
+        elapsed = time.perf_counter() - start
+        matched = sum(1 for doi in found if doi == 'match')
+        wrong = sum(1 for doi in found if doi not in (None, 'match'))
+        print(f'{name:>22}: {pairs:5d} pairs in {elapsed * 1000:7.1f}ms '
+              f'({pairs / elapsed:8.0f} pairs/s), {matched:4d}/{N_TITLES} matched, '
+              f'{wrong:3d} wrong')
@@ -10,4 +10,4 @@ echo "MySQL started"
 
 cd /opt/app || exit
 
-python -m pytest --cov=annette tests/
+env -u RESPONSE_CACHE_PATH python -m pytest --cov=annette tests/
@@ -0,0 +1,65 @@
+import numpy as np
+
+from annette.db.models import CitationFeatures, ExtractedCitation
+from annette.stages.classify import FeatureStore
+from annette.stages.identify import BaseIdentifier
+from .. import data
+
+
+class TestFeatureStore:
+    def add_citation(self, session_manager, doi, **kwargs):
+        extracted = data.extracted_citation(**kwargs)
+        session_manager.add(extracted)
+        citation = data.citation(doi=doi, ecid=extracted.id)
+        session_manager.add(citation)
+        return citation
+
+    def test_stored_when_identified(self, session_manager):
+        extracted = data.extracted_citation(label_id='Label_3', snippet_match=4)
+        session_manager.add(extracted)
+        BaseIdentifier(session_manager).store_citations(
+            [data.citation(doi='test-features', ecid=extracted.id)])
+        features = session_manager.session.query(CitationFeatures).get('test-features')
+        assert features.snippet_match == 4
+        assert features.L_Label_3 == 1
+        assert features.L_Label_4 == 0
+
+    def test_reads_stored(self, session_manager):
+        store = FeatureStore(session_manager.session)
+        self.add_citation(session_manager, 'test-features', snippet_match=1)
+        store.update(['test-features'])
+        # change the underlying data without updating the store
+        session_manager.session.query(ExtractedCitation).update({'snippet_match': 100})
+        assert store.read(['test-features']).snippet_match[0] == 1
+        store.update()
+        assert store.read(['test-features']).snippet_match[0] == 100
+
+    def test_reads_missing(self, session_manager):
+        store = FeatureStore(session_manager.session)
+        self.add_citation(session_manager, 'test-features', label_id='Label_8')
+        features = store.read(['test-features', 'not-a-real-doi'])
+        assert list(features.doi) == ['test-features']
+        assert list(features.columns[1:]) == store.features
+        assert features.L_Label_8[0] == 1
+        assert session_manager.session.query(CitationFeatures).count() == 1
+
+    def test_read_matrix(self, session_manager):
+        self.add_citation(session_manager, 'test-features-b', label_id='Label_8', snippet_match=2,
+                          highlight_length=None)
+        self.add_citation(session_manager, 'test-features-a', label_id='Label_1')
+        dois, matrix = FeatureStore(session_manager.session).read_matrix(
+            ['test-features-b', 'test-features-a'])
+        assert dois == ['test-features-a', 'test-features-b']
+        assert matrix.dtype == np.float32
+        assert matrix.tolist() == [[0, 0, 0, 1, 0, 0, 0, 0, 0], [0, 2, 0, 0, 0, 0, 0, 0, 1]]
+
+    def test_aggregate(self):
+        rows = [('b', 1, 2, 10, 'Label_2'),
+                ('b', 1, 2, 10, 'Label_2'),  # repeated rows only count once
+                ('b', 1, 4, None, 'Label_5'),
+                ('a', 0, None, None, None),
+                ('a', 0, 1, 1, 'not-a-label')]
+        dois, matrix = FeatureStore.aggregate(rows)
+        assert list(dois) == ['a', 'b']
+        assert matrix.dtype == np.float32
+        assert matrix.tolist() == [[0, 1, 1, 0, 0, 0, 0, 0, 0], [1, 3, 10, 0, 1, 0, 0, 1, 0]]
@@ -0,0 +1,44 @@
+import pytest
+
+from annette.db.models import NHMPub
+from annette.stages.classify.forest import RandomForestClassifier
+from .. import data
+
+
+class TestRandomForestClassifier:
+    @pytest.fixture
+    def classifier(self, session_manager, mocker):
+        mocker.patch.object(RandomForestClassifier, 'load_model')
+        return RandomForestClassifier(session_manager)
+
+    def add_citation(self, session_manager, doi, issn, **kwargs):
+        extracted = data.extracted_citation(**kwargs)
+        session_manager.add(extracted)
+        session_manager.add(data.citation(doi=doi, issn=issn, ecid=extracted.id,
+                                          classification_id=None))
+
+    def test_grouped_data(self, classifier, session_manager):
+        session_manager.add(NHMPub(issn='1234-5678', pub_title='NHM journal'))
+        self.add_citation(session_manager, 'test-forest-b', '1234-5678', label_id='Label_2',
+                          snippet_match=2, highlight_length=10)
+        self.add_citation(session_manager, 'test-forest-a', '0000-0000', label_id=None,
+                          snippet_match=1, highlight_length=None)
+        self.add_citation(session_manager, 'test-forest-c', '1234-5678', label_id='Label_1',
+                          snippet_match=3, highlight_length=3)
+
+        grouped_data = classifier.grouped_data(['test-forest-a', 'test-forest-b'])
+        # only the requested dois, in order
+        assert list(grouped_data.doi) == ['test-forest-a', 'test-forest-b']
+        assert list(grouped_data.columns[1:]) == [
+            'nhm_sub', 'snippet_match', 'highlight_length', 'L_Label_1', 'L_Label_2',
+            'L_Label_3', 'L_Label_4', 'L_Label_5', 'L_Label_8']
+        assert list(grouped_data.iloc[0, 1:]) == [0, 1, 0, 0, 0, 0, 0, 0, 0]
+        assert list(grouped_data.iloc[1, 1:]) == [1, 2, 10, 0, 1, 0, 0, 0, 0]
+
+    def test_process_data(self, classifier, session_manager):
+        self.add_citation(session_manager, 'test-forest-a', None)
+        self.add_citation(session_manager, 'test-forest-b', None)
+        classifier.model.predict.side_effect = lambda x: [1] * len(x)
+        citations = classifier.get_data()
+        classifier.process_data(citations)
+        assert {c.classification_id for c in citations} == {'1'}
@@ -1,9 +1,14 @@
 import os
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
 
 import mock
 import pytest
+from sqlalchemy import event
 
 from annette.db.session import SessionManager
+from annette.utils import cache
 from . import data
 
 with mock.patch('annette.db.session.SessionManager.database_url',
@@ -20,3 +25,36 @@ def session_manager():
             _sm.session.add(test_data)
             _sm.session.flush()
         yield _sm
+
+
+Statement = namedtuple('Statement', ['sql', 'thread'])
+
+
+@pytest.fixture
+def sql_statements(session_manager):
+    """
+    A context manager that records the SQL statements executed on the test database inside it.
+    :return: function returning a context manager that yields a list of Statements
+    """
+
+    @contextmanager
+    def _record():
+        statements = []
+
+        def _listener(conn, cursor, statement, *args):
+            statements.append(Statement(statement, threading.current_thread()))
+
+        event.listen(session_manager._engine, 'before_cursor_execute', _listener)
+        try:
+            yield statements
+        finally:
+            event.remove(session_manager._engine, 'before_cursor_execute', _listener)
+
+    return _record
+
+
+@pytest.fixture(autouse=True)
+def response_cache(monkeypatch):
+    # don't let tests see responses cached by other tests or by real runs
+    monkeypatch.delenv('RESPONSE_CACHE_PATH', raising=False)
+    monkeypatch.setattr(cache, '_cache', cache.ResponseCache(None))
@@ -58,6 +58,7 @@ def extracted_citation(**kwargs):
                 snippet_match=0,
                 highlight_length=0,
                 last_identify_run=None,
+                next_identify_run=None,
                 log_id=2)
     data.update(kwargs)
     return ExtractedCitation(**data)
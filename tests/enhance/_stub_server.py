@@ -0,0 +1,63 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubServer(object):
+    """
+    A local HTTP server that stands in for an external API. Responses are JSON, given by a
+    function of the request path; the server records each request and the client connection
+    it arrived on.
+    """
+
+    def __init__(self, respond, delay=0):
+        """
+        :param respond: function taking the request path and returning (status code, JSON data)
+        :param delay: seconds to wait before responding to each request
+        """
+        self.respond = respond
+        self.delay = delay
+        self.requests = []
+        self.connections = set()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f'http://{host}:{port}'
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep connections open
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.requests.append(self.path)
+                    stub.connections.add(self.client_address)
+                time.sleep(stub.delay)
+                status, data = stub.respond(self.path)
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._server.shutdown()
+        self._server.server_close()
@@ -1,13 +1,17 @@
-from annette.db.models import Access, Metrics
+import threading
+
+import pytest
+
+from annette.db.models import Access, EnhanceCheckpoint, Metrics
 from annette.stages.enhance import EnhanceCore
 from .. import data
 
 
 class TestCore:
     def test_gets_metadata(self, session_manager, mocker):
-        mocker.patch('annette.stages.enhance.dimensions.DimensionsEnhancer.get_metadata',
+        mocker.patch('annette.stages.enhance.dimensions.DimensionsEnhancer.get_all_metadata',
                      return_value=[data.metrics()])
-        mocker.patch('annette.stages.enhance.unpaywall.UnpaywallEnhancer.get_metadata',
+        mocker.patch('annette.stages.enhance.unpaywall.UnpaywallEnhancer.get_all_metadata',
                      return_value=[data.access()])
         metadata = EnhanceCore.run(session_manager)
         assert len(metadata) == 2
@@ -16,15 +20,82 @@ class TestCore:
 
     def test_skips_recent(self, session_manager, mocker):
         # mock the get_metadata methods just in case
-        mocker.patch('annette.stages.enhance.dimensions.DimensionsEnhancer.get_metadata',
+        mocker.patch('annette.stages.enhance.dimensions.DimensionsEnhancer.get_all_metadata',
                      return_value=['dimensions'])
-        mocker.patch('annette.stages.enhance.unpaywall.UnpaywallEnhancer.get_metadata',
+        mocker.patch('annette.stages.enhance.unpaywall.UnpaywallEnhancer.get_all_metadata',
                      return_value=['unpaywall'])
         mocker.patch('annette.stages.enhance.dimensions.DimensionsEnhancer.run_now', False)
         mocker.patch('annette.stages.enhance.unpaywall.UnpaywallEnhancer.run_now', False)
         metadata = EnhanceCore.run(session_manager)
         assert len(metadata) == 0
 
+    def test_runs_enhancers_concurrently(self, session_manager, mocker):
+        # both enhancers have to be running at the same time to get past the barrier
+        barrier = threading.Barrier(2, timeout=5)
+        sessions = []
+
+        def get_all_metadata(enhancer, citations):
+            sessions.append(enhancer.session)
+            barrier.wait()
+            return [enhancer.model()]
+
+        for enhancer in ['dimensions.DimensionsEnhancer', 'unpaywall.UnpaywallEnhancer']:
+            mocker.patch(f'annette.stages.enhance.{enhancer}.get_all_metadata', get_all_metadata)
+            mocker.patch(f'annette.stages.enhance.{enhancer}.run_now', True)
+        metadata = EnhanceCore.run(session_manager)
+        assert [type(m) for m in metadata] == [Metrics, Access]
+        assert len({id(s) for s in sessions + [session_manager.session]}) == 3
+
+    def test_stores_updated_metadata(self, session_manager, mocker):
+        metrics = data.metrics(times_cited=1, doi='10.1000/test-core-update', log_id=None)
+        session_manager.add(data.citation(doi=metrics.doi), metrics)
+        mocker.patch('annette.stages.enhance.dimensions.DimensionsEnhancer.fetch_metadata',
+                     return_value={'doi': metrics.doi, 'times_cited': 2})
+        mocker.patch('annette.stages.enhance.dimensions.DimensionsEnhancer.run_now', True)
+        mocker.patch('annette.stages.enhance.unpaywall.UnpaywallEnhancer.run_now', False)
+        metadata = EnhanceCore.run(session_manager)
+        assert metrics.id in [m.id for m in metadata]
+        EnhanceCore.store(session_manager, metadata)
+        session_manager.session.expire_all()
+        assert session_manager.session.query(Metrics).get(metrics.id).times_cited == 2
+
+    def test_resumes_interrupted_run(self, session_manager, mocker):
+        dois = [f'10.1000/test-resume-{i}' for i in range(5)]
+        session_manager.add(*[data.citation(doi=doi) for doi in dois])
+        fetched = []
+        failed = []
+
+        def fetch_metadata(enhancer, doi):
+            if doi == dois[3] and not failed:
+                failed.append(doi)
+                raise ConnectionError()
+            fetched.append(doi)
+            return {'doi': doi, 'times_cited': 1}
+
+        mocker.patch('annette.stages.enhance.dimensions.DimensionsEnhancer.fetch_metadata',
+                     fetch_metadata)
+        mocker.patch('annette.stages.enhance.dimensions.DimensionsEnhancer.commit_size', 2)
+        mocker.patch('annette.stages.enhance.dimensions.DimensionsEnhancer.run_now', True)
+        mocker.patch('annette.stages.enhance.unpaywall.UnpaywallEnhancer.run_now', False)
+        with pytest.raises(ConnectionError):
+            EnhanceCore.run(session_manager)
+        # the first batch was committed before the error
+        stored = session_manager.session.query(Metrics.doi).filter(Metrics.doi.in_(dois)).all()
+        assert sorted(doi for doi, in stored) == dois[:2]
+        checkpoint = session_manager.session.query(EnhanceCheckpoint).one()
+        assert checkpoint.last_doi == dois[1]
+        assert not checkpoint.complete
+
+        # the next run carries on from the checkpoint even though it isn't due to run
+        fetched.clear()
+        mocker.patch('annette.stages.enhance.dimensions.DimensionsEnhancer.run_now', False)
+        metadata = EnhanceCore.run(session_manager)
+        assert fetched[0] == dois[2]
+        assert not set(fetched) & set(dois[:2])
+        assert {m.doi for m in metadata} >= set(dois[2:])
+        session_manager.session.expire_all()
+        assert session_manager.session.query(EnhanceCheckpoint).one().complete
+
     def test_stores_metadata(self, session_manager):
         metadata = [data.metrics(times_cited=123456789), data.access(best_oa_url='http://test-core-oa-url.com')]
         EnhanceCore.store(session_manager, metadata)
@@ -1,10 +1,15 @@
+import re
+import time
 from datetime import datetime as dt, timedelta
 
 import mock
+import pytest
 import requests
 
 from annette.db.models import Metrics
 from annette.stages.enhance.dimensions import DimensionsEnhancer
+from annette.utils.cache import ResponseCache
+from annette.utils.rate import RateLimiter
 from .test_enhancers import TestEnhancer
 from .. import data
 
@@ -34,9 +39,17 @@ class TestDimensionsEnhancer(TestEnhancer):
         session_manager.add(citation, metrics)
         assert not enhancer.run_now  # just now
 
+    def test_run_now_unfinished(self, enhancer, session_manager):
+        # the only entries are from a run that didn't finish
+        runlog = data.runlog(start=dt.now(), end=None, enhance=True)
+        session_manager.add(runlog)
+        session_manager.add(data.metrics(log_id=runlog.id))
+        session_manager.session.query(Metrics).filter(Metrics.log_id != runlog.id).delete()
+        assert enhancer.run_now
+
     def test_handles_error(self, enhancer, mocker):
         error_url = 'http://www.mocky.io/v2/5e4d295e2d00007f00c0daff'  # just a 418 response
-        mocker.patch('requests.get', return_value=requests.get(error_url))
+        mocker.patch('requests.Session.get', return_value=requests.get(error_url))
         citation = enhancer.get_data()[0]
         assert len(enhancer.get_metadata(citation)) == 0
 
@@ -52,7 +65,7 @@ class TestDimensionsEnhancer(TestEnhancer):
             'relative_citation_ratio': None,
             'field_citation_ratio': None
             }
-        mocker.patch('requests.get', return_value=response)
+        mocker.patch('requests.Session.get', return_value=response)
         citation = enhancer.get_data()[0]
         metrics = enhancer.get_metadata(citation)
         assert len(metrics) == 1
@@ -80,7 +93,7 @@ class TestDimensionsEnhancer(TestEnhancer):
 
         response = mock.MagicMock(ok=True)
         response.json.return_value = update_data
-        mocker.patch('requests.get', return_value=response)
+        mocker.patch('requests.Session.get', return_value=response)
 
         metrics = enhancer.get_metadata(citation)[0]
         assert all([old_data[k] != getattr(metrics, k) for k in update_data.keys()])
@@ -102,8 +115,137 @@ class TestDimensionsEnhancer(TestEnhancer):
             'relative_citation_ratio': 1.234,
             'field_citation_ratio': 4.321
             }
-        mocker.patch('requests.get', return_value=response)
+        mocker.patch('requests.Session.get', return_value=response)
 
         metrics = enhancer.get_metadata(citation)
         assert len(metrics) == 1
         assert all([getattr(metrics[0], k) == v for k, v in response.json.return_value.items()])
+
+    def test_get_all_metadata_concurrently(self, enhancer, mocker):
+        def _slow_response(url):
+            time.sleep(0.2)
+            response = mock.MagicMock(ok=True)
+            response.json.return_value = {
+                'times_cited': int(url.split('-')[-1]),
+                'recent_citations': 12,
+                'relative_citation_ratio': 1.234,
+                'field_citation_ratio': 4.321
+                }
+            return response
+
+        mocker.patch('requests.Session.get', side_effect=_slow_response)
+        enhancer.rate_limiter = RateLimiter(100, burst=8)
+        citations = [data.citation(doi=f'test_concurrent-{i}') for i in range(8)]
+        start = time.monotonic()
+        metrics = enhancer.get_all_metadata(citations)
+        # the requests overlap, so it should take much less than 8 * 0.2s
+        assert time.monotonic() - start < 1
+        assert [m.doi for m in metrics] == [c.doi for c in citations]
+        assert [m.times_cited for m in metrics] == list(range(8))
+
+    def test_uses_cache(self, enhancer, mocker, tmp_path):
+        response = mock.MagicMock(ok=True)
+        response.json.return_value = {
+            'times_cited': 123,
+            'recent_citations': 12,
+            'relative_citation_ratio': None,
+            'field_citation_ratio': None
+            }
+        get = mocker.patch('requests.Session.get', return_value=response)
+        enhancer.cache = ResponseCache(str(tmp_path / 'cache.sqlite'))
+        doi = enhancer.get_data()[0].doi
+        first = enhancer.fetch_metadata(doi)
+        assert enhancer.fetch_metadata(doi) == first
+        assert get.call_count == 1
+        assert enhancer.cache.stats()['DimensionsEnhancer'] == {'hits': 1, 'misses': 1}
+
+    def test_batches_requests(self, enhancer, mocker):
+        def _post(url, data=None, json=None, headers=None):
+            response = mock.MagicMock(ok=True, status_code=200)
+            if url.endswith('/auth.json'):
+                response.json.return_value = {'token': 'test-token'}
+            else:
+                assert headers['Authorization'] == 'JWT test-token'
+                dois = re.findall(r'"([^"]+)"', data.decode())
+                # the last DOI isn't found
+                response.json.return_value = {'publications': [
+                    {'doi': d.upper(), 'times_cited': int(d.split('-')[-1]), 'recent_citations': 1}
+                    for d in dois if not d.endswith('-6')]}
+            return response
+
+        post = mocker.patch('requests.Session.post', side_effect=_post)
+        get = mocker.patch('requests.Session.get')
+        enhancer.api_key = 'test-key'
+        enhancer.batch_size = 3
+        enhancer.batch_rate_limiter = RateLimiter(100, burst=10)
+        citations = [data.citation(doi=f'test_batch-{i}') for i in range(7)]
+        metrics = enhancer.get_all_metadata(citations)
+        assert post.call_count == 4  # one to get a token, then one per batch
+        assert get.call_count == 0
+        assert [m.doi for m in metrics] == [c.doi for c in citations[:6]]
+        assert [m.times_cited for m in metrics] == list(range(6))
+        assert all(m.field_citation_ratio == 0 for m in metrics)
+
+    def test_batch_falls_back_to_single(self, enhancer, mocker):
+        post = mocker.patch('requests.Session.post',
+                            return_value=mock.MagicMock(ok=False, status_code=500, **{
+                                'raise_for_status.side_effect': requests.HTTPError()}))
+        response = mock.MagicMock(ok=True)
+        response.json.return_value = {'times_cited': 123}
+        get = mocker.patch('requests.Session.get', return_value=response)
+        enhancer.api_key = 'test-key'
+        enhancer.rate_limiter = RateLimiter(100, burst=10)
+        citations = [data.citation(doi=f'test_batch_fallback-{i}') for i in range(3)]
+        metrics = enhancer.get_all_metadata(citations)
+        assert post.call_count == 1
+        assert get.call_count == 3
+        assert [m.times_cited for m in metrics] == [123] * 3
+
+    @pytest.mark.parametrize('token_response, dsl_response', [
+        ({'error': 'Bad key'}, {'publications': []}),
+        ({'token': 'test-token'}, {'errors': ['Query failed']}),
+        ({'token': 'test-token'}, ValueError('Not JSON')),
+        ])
+    def test_batch_falls_back_on_bad_response(self, enhancer, mocker, token_response,
+                                              dsl_response):
+        def _post(url, data=None, json=None, headers=None):
+            response = mock.MagicMock(ok=True, status_code=200)
+            if url.endswith('/auth.json'):
+                response.json.return_value = token_response
+            elif isinstance(dsl_response, Exception):
+                response.json.side_effect = dsl_response
+            else:
+                response.json.return_value = dsl_response
+            return response
+
+        mocker.patch('requests.Session.post', side_effect=_post)
+        response = mock.MagicMock(ok=True)
+        response.json.return_value = {'times_cited': 123}
+        get = mocker.patch('requests.Session.get', return_value=response)
+        enhancer.api_key = 'test-key'
+        enhancer.rate_limiter = RateLimiter(100, burst=10)
+        enhancer.batch_rate_limiter = RateLimiter(100, burst=10)
+        citations = [data.citation(doi=f'test_batch_bad-{i}') for i in range(3)]
+        metrics = enhancer.get_all_metadata(citations)
+        # nothing is cached as not found, so every DOI is requested separately
+        assert get.call_count == 3
+        assert [m.times_cited for m in metrics] == [123] * 3
+
+    def test_bulk_updates_changed_only(self, enhancer, mocker, session_manager,
+                                       sql_statements):
+        existing = [data.metrics(doi=f'test_bulk_update-{i}', times_cited=i) for i in range(3)]
+        session_manager.add(*[data.citation(doi=m.doi) for m in existing], *existing)
+        fetched = {m.doi: {'doi': m.doi, 'times_cited': m.times_cited,
+                           'recent_citations': m.recent_citations,
+                           # as read back from a single precision FLOAT column
+                           'relative_citation_ratio': 0.6000000238418579,
+                           'field_citation_ratio': m.field_citation_ratio} for m in existing}
+        fetched[existing[1].doi]['times_cited'] = 100
+        mocker.patch.object(enhancer, 'fetch_metadata', side_effect=lambda doi: fetched[doi])
+        metrics = enhancer.get_all_metadata([data.citation(doi=m.doi) for m in existing])
+        assert [(m.id, m.times_cited) for m in metrics] == [(existing[1].id, 100)]
+        with sql_statements() as statements:
+            enhancer.store_metadata(metrics)
+        assert len([s for s in statements if s.sql.startswith('UPDATE')]) == 1
+        session_manager.session.expire_all()
+        assert [m.times_cited for m in existing] == [0, 100, 2]
@@ -1,8 +1,9 @@
 import pytest
+
 from annette.stages.enhance import BaseEnhancer
 from annette.db.models import Citation
 from .. import data
-from datetime import datetime as dt
+from datetime import datetime as dt, timedelta
 
 
 class TestEnhancer:
@@ -27,3 +28,83 @@ class TestEnhancer:
         citation = data.citation(log_id=runlog.id, doi='not-a-real-doi')
         session_manager.add(citation)
         assert enhancer.run_now
+
+    def test_prefetches_previous(self, enhancer, mocker, sql_statements):
+        """
+        Existing entries for all the citations should be loaded in one query, not one each.
+        """
+        if enhancer.model is None:
+            pytest.skip('No model to query.')
+        mocker.patch.object(enhancer, 'fetch_metadata', side_effect=lambda doi: {'doi': doi})
+        citations = enhancer.get_data() + [data.citation(doi=f'test_prefetch-{i}') for i in
+                                           range(10)]
+        with sql_statements() as statements:
+            metadata = enhancer.get_all_metadata(citations)
+        assert len([s for s in statements if enhancer.model.__tablename__ in s.sql]) == 1
+        # the existing entry hasn't changed, so only the new ones are returned
+        assert sorted([m.doi for m in metadata]) == sorted([c.doi for c in citations[-10:]])
+
+    def test_get_data_only_stale(self, enhancer, session_manager):
+        """
+        Only classified citations with missing or out of date metadata should be loaded.
+        """
+        if enhancer.model is None:
+            pytest.skip('No model to query.')
+        stale_runlog = data.runlog(start=dt.now() - enhancer.refresh_interval - timedelta(days=2),
+                                   end=dt.now() - enhancer.refresh_interval - timedelta(days=1))
+        fresh_runlog = data.runlog(start=dt.now(), end=dt.now())
+        # a run that stopped without finishing, so has no end time
+        crashed_runlog = data.runlog(start=dt.now() - enhancer.refresh_interval - timedelta(days=2),
+                                     end=None)
+        session_manager.add(stale_runlog, fresh_runlog, crashed_runlog)
+        citations = {k: data.citation(doi=f'test_stale-{k}') for k in
+                     ['stale', 'fresh', 'missing', 'unclassified', 'irrelevant', 'crashed',
+                      'current']}
+        citations['unclassified'].classification_id = None
+        citations['irrelevant'].classification_id = 0
+        session_manager.add(*citations.values())
+        session_manager.add(enhancer.model(doi=citations['stale'].doi, log_id=stale_runlog.id),
+                            enhancer.model(doi=citations['fresh'].doi, log_id=fresh_runlog.id),
+                            enhancer.model(doi=citations['crashed'].doi, log_id=crashed_runlog.id),
+                            enhancer.model(doi=citations['current'].doi,
+                                           log_id=session_manager.runlog.id))
+
+        dois = [c.doi for c in enhancer.get_data()]
+        assert citations['stale'].doi in dois
+        assert citations['missing'].doi in dois
+        assert citations['crashed'].doi in dois
+        assert citations['fresh'].doi not in dois
+        assert citations['current'].doi not in dois
+        assert citations['unclassified'].doi not in dois
+        assert citations['irrelevant'].doi not in dois
+
+    def test_marks_checked(self, enhancer, session_manager, mocker):
+        """
+        Entries that were checked but haven't changed shouldn't be loaded again on the next run.
+        """
+        if enhancer.model is None:
+            pytest.skip('No model to query.')
+        stale_runlog = data.runlog(start=dt.now() - enhancer.refresh_interval - timedelta(days=2),
+                                   end=dt.now() - enhancer.refresh_interval - timedelta(days=1))
+        session_manager.add(stale_runlog)
+        citation = data.citation(doi='test_checked')
+        session_manager.add(citation)
+        session_manager.add(enhancer.model(doi=citation.doi, log_id=stale_runlog.id))
+        assert citation.doi in [c.doi for c in enhancer.get_data()]
+        # nothing has changed, so there's nothing to store
+        mocker.patch.object(enhancer, 'get_all_metadata', return_value=[])
+        enhancer.enhance([citation])
+        assert citation.doi not in [c.doi for c in enhancer.get_data()]
+
+    def test_workers_get_dois(self, enhancer, mocker):
+        """
+        The worker threads should only be given DOIs, not Citation instances from the session.
+        """
+        if enhancer.model is None:
+            pytest.skip('No model to query.')
+        fetch = mocker.patch.object(enhancer, 'fetch_metadata',
+                                    side_effect=lambda doi: {'doi': doi})
+        citations = [data.citation(doi=f'test_workers-{i}') for i in range(3)]
+        metadata = enhancer.get_all_metadata(citations)
+        assert sorted(c[0][0] for c in fetch.call_args_list) == [c.doi for c in citations]
+        assert [m.doi for m in metadata] == [c.doi for c in citations]
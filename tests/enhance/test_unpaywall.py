@@ -5,8 +5,10 @@ import requests
 
 from annette.db.models import Access
 from annette.stages.enhance.unpaywall import UnpaywallEnhancer
+from annette.utils.rate import RateLimiter
 from tests.enhance.test_enhancers import TestEnhancer
 from .. import data
+from ._stub_server import StubServer
 
 
 class TestUnpaywallEnhancer(TestEnhancer):
@@ -37,7 +39,7 @@ class TestUnpaywallEnhancer(TestEnhancer):
 
     def test_handles_error(self, enhancer, mocker):
         error_url = 'http://www.mocky.io/v2/5e4d295e2d00007f00c0daff'  # just a 418 response
-        mocker.patch('requests.get', return_value=requests.get(error_url))
+        mocker.patch('requests.Session.get', return_value=requests.get(error_url))
         citation = enhancer.get_data()[0]
         assert len(enhancer.get_metadata(citation)) == 0
 
@@ -51,7 +53,7 @@ class TestUnpaywallEnhancer(TestEnhancer):
             'is_oa': True,
             'doi': 'test_returns_access-doi'
             }
-        mocker.patch('requests.get', return_value=response)
+        mocker.patch('requests.Session.get', return_value=response)
         citation = enhancer.get_data()[0]
         access = enhancer.get_metadata(citation)
         assert len(access) == 1
@@ -87,7 +89,7 @@ class TestUnpaywallEnhancer(TestEnhancer):
 
         response = mock.MagicMock(ok=True)
         response.json.return_value = update_data
-        mocker.patch('requests.get', return_value=response)
+        mocker.patch('requests.Session.get', return_value=response)
 
         access = enhancer.get_metadata(citation)
         oa_loc = response.json.return_value['best_oa_location']  # just to make the asserts tidier
@@ -130,7 +132,7 @@ class TestUnpaywallEnhancer(TestEnhancer):
             'has_repository_copy': True,
             'is_oa': True
             }
-        mocker.patch('requests.get', return_value=response)
+        mocker.patch('requests.Session.get', return_value=response)
 
         access = enhancer.get_metadata(citation)
         oa_loc = response.json.return_value['best_oa_location']  # just to make the asserts tidier
@@ -142,3 +144,35 @@ class TestUnpaywallEnhancer(TestEnhancer):
         assert access[0].is_oa
         assert access[0].host_type == oa_loc['host_type']
         assert access[0].version == oa_loc['version']
+
+    def test_rate_limit_within_daily_limit(self, enhancer):
+        # Unpaywall's limit is 100,000 requests a day
+        assert enhancer.rate_limit * 24 * 60 * 60 <= 100000
+
+    def test_get_all_metadata_from_server(self, enhancer, mocker):
+        def _respond(path):
+            doi = path.split('?')[0].split('/', 2)[-1]
+            if doi.endswith('missing'):
+                return 404, {'error': True}
+            return 200, {
+                'best_oa_location': {
+                    'url': f'https://oa.xyz/{doi}',
+                    'updated': '2020-01-01T00:00:00.000000'
+                    },
+                'is_oa': True,
+                'doi': doi
+                }
+
+        citations = [data.citation(doi=f'test_server-{i}') for i in range(20)]
+        citations[5].doi = 'test_server-missing'
+        # the real rate limit would make this take 20 seconds
+        enhancer.rate_limiter = RateLimiter(100)
+        with StubServer(_respond, delay=0.05) as server:
+            mocker.patch.object(enhancer, 'base_url', server.url + '/v2')
+            access = enhancer.get_all_metadata(citations)
+        assert len(server.requests) == 20
+        assert all(['email=' in r for r in server.requests])
+        # connections are pooled, so there should be (at most) one per worker
+        assert len(server.connections) <= enhancer.workers
+        assert [a.doi for a in access] == [c.doi for c in citations if c.doi[-1].isdigit()]
+        assert access[0].best_oa_url == 'https://oa.xyz/test_server-0'
@@ -40,6 +40,19 @@ email_list = [
         }
     ]
 
+multi_citation_email = {
+    'id': 'multiple_citations',
+    'harvested_date': '2019-01-01',
+    'label': 'Label_8',
+    'received_date': '2019-01-01',
+    'body': ('<html><body><div><h3><a href="http://scholar.google.co.uk" '
+             'class="gse_alrt_title">First result, without a snippet</a></h3><div>Dr A - '
+             'Exciting Journal, 2019</div></div><div><h3><a href="http://scholar.google.co.uk" '
+             'class="gse_alrt_title">Second result</a></h3><div>Dr B - Exciting Journal, '
+             '2019</div><div class="gse_alrt_sni">specimens used from: ' +
+             email.natural_history_museum + '</div></div></body></html>').encode()
+    }
+
 raw_email_data_1 = {
     'id': 'journal_with_year',
     'threadId': 'journal_with_year',
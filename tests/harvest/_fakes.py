@@ -0,0 +1,80 @@
+import copy
+import time
+
+from . import _constants as constants
+
+
+class FakeRequest:
+    def __init__(self, service, response=None, error=None):
+        self.service = service
+        self.response = response
+        self.error = error
+
+    def execute(self):
+        self.service.round_trip()
+        return self._result()
+
+    def _result(self):
+        if self.error is not None:
+            raise self.error
+        return self.response
+
+
+class FakeBatchRequest:
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id=None):
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        self.service.round_trip()
+        self.service.batch_sizes.append(len(self.requests))
+        for request_id, request in self.requests:
+            try:
+                self.callback(request_id, request._result(), None)
+            except Exception as e:
+                self.callback(request_id, None, e)
+
+
+class FakeGmailService:
+    """
+    Stands in for the Gmail API service object so message retrieval can be tested (and timed)
+    without a network connection. Every message returns a copy of raw_email_data_1.
+    """
+
+    def __init__(self, latency=0, errors=None):
+        """
+        :param latency: seconds to wait for each simulated HTTP round trip
+        :param errors: dict of email id -> exception raised when getting that message
+        """
+        self.latency = latency
+        self.errors = errors or {}
+        self.round_trips = 0
+        self.batch_sizes = []
+        self.modified = []
+
+    def round_trip(self):
+        self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def get(self, userId, id, format):
+        email_data = copy.deepcopy(constants.raw_email_data_1)
+        email_data['id'] = id
+        return FakeRequest(self, response=email_data, error=self.errors.get(id))
+
+    def batchModify(self, userId, body):
+        self.modified.append(body)
+        return FakeRequest(self, response={})
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatchRequest(self, callback)
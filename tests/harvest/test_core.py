@@ -0,0 +1,117 @@
+import mock
+import pytest
+from sqlalchemy.exc import InternalError
+
+from annette.db.models import ExtractedCitation
+from annette.stages.harvest import BaseHarvester, HarvestCore
+from .. import data
+
+
+class StubHarvester(BaseHarvester):
+    chunk_size = 2
+
+    def get_data(self):
+        yield from range(5)
+
+    def parse_data(self, data):
+        for i in data:
+            yield ExtractedCitation(email_id=f'test_core_{i}')
+
+
+class TestCore:
+    def test_stream_stores_citations(self, session_manager, mocker):
+        mocker.patch.object(HarvestCore, 'harvesters', [StubHarvester])
+        assert HarvestCore.stream(session_manager) == 5
+        stored = session_manager.session.query(ExtractedCitation).filter(
+            ExtractedCitation.email_id.like('test_core_%')).all()
+        assert len(stored) == 5
+        assert all([c.log_id == session_manager.runlog.id for c in stored])
+
+    def test_store_rejects_bad_rows(self, session_manager):
+        citations = [data.extracted_citation(email_id=f'test_core_{i}') for i in range(5)]
+        citations[1].source = 'not a two-letter source'
+        citations[3].source = 'also too long'
+        harvester = BaseHarvester(session_manager)
+        assert harvester.store_citations(citations) == 3
+        assert harvester.rejected == [citations[1], citations[3]]
+        stored = session_manager.session.query(ExtractedCitation).filter(
+            ExtractedCitation.email_id.like('test_core_%')).all()
+        assert sorted([c.email_id for c in stored]) == ['test_core_0', 'test_core_2',
+                                                        'test_core_4']
+
+    def test_store_rejects_bad_emails(self, session_manager):
+        # a bad row means the rest of the email's citations are rejected too
+        citations = [data.extracted_citation(email_id=f'test_core_{i // 2}') for i in range(4)]
+        citations[3].source = 'not a two-letter source'
+        harvester = BaseHarvester(session_manager)
+        assert harvester.store_citations(citations) == 2
+        assert harvester.rejected == citations[2:]
+
+    def test_store_rejects_incorrect_strings(self):
+        bad_string = InternalError('INSERT', {}, Exception(1366, 'Incorrect string value'))
+        harvester = BaseHarvester(mock.MagicMock())
+        harvester.session_manager.session.execute.side_effect = [bad_string, None, bad_string]
+        citations = [ExtractedCitation(email_id=f'test_core_{i}') for i in range(2)]
+        assert harvester.store_citations(citations) == 1
+        assert harvester.rejected == citations[1:]
+
+    def test_store_raises_other_errors(self):
+        timeout = InternalError('INSERT', {}, Exception(1205, 'Lock wait timeout exceeded'))
+        harvester = BaseHarvester(mock.MagicMock())
+        harvester.session_manager.session.execute.side_effect = timeout
+        with pytest.raises(InternalError):
+            harvester.store_citations([ExtractedCitation(email_id='test_core_0')])
+        assert harvester.session_manager.session.execute.call_count == 1
+        assert harvester.rejected == []
+
+    def test_store_raises_if_every_email_fails(self):
+        bad_string = InternalError('INSERT', {}, Exception(1366, 'Incorrect string value'))
+        harvester = BaseHarvester(mock.MagicMock())
+        harvester.session_manager.session.execute.side_effect = bad_string
+        citations = [ExtractedCitation(email_id=f'test_core_{i}') for i in range(3)]
+        with pytest.raises(InternalError):
+            harvester.store_citations(citations)
+        assert harvester.rejected == []
+
+    def test_store_uses_defaults(self, session_manager):
+        BaseHarvester(session_manager).store_citations([ExtractedCitation(email_id='test_core_0')])
+        stored = session_manager.session.query(ExtractedCitation).filter(
+            ExtractedCitation.email_id == 'test_core_0').one()
+        assert stored.identify_attempts == 0
+
+    def test_stream_keeps_stored_chunks(self, session_manager, mocker):
+        def _failing_parse(self, data):
+            for i in data:
+                if i == 3:
+                    raise ValueError('Parsing failed')
+                yield ExtractedCitation(email_id=f'test_core_{i}')
+
+        mocker.patch.object(HarvestCore, 'harvesters', [StubHarvester])
+        mocker.patch.object(StubHarvester, 'parse_data', _failing_parse)
+        try:
+            HarvestCore.stream(session_manager)
+        except ValueError:
+            pass
+        stored = session_manager.session.query(ExtractedCitation).filter(
+            ExtractedCitation.email_id.like('test_core_%')).all()
+        assert len(stored) == 2  # the first chunk
+
+    def test_store_skips_stored_emails(self, session_manager):
+        harvester = BaseHarvester(session_manager)
+        harvester.chunk_size = 2
+        # e.g. left unread by an interrupted run and harvested again
+        session_manager.add(data.extracted_citation(email_id='test_core_0'))
+        citations = [data.extracted_citation(email_id=f'test_core_{i // 3}') for i in range(6)]
+        assert harvester.store_citations(citations) == 3
+        stored = session_manager.session.query(ExtractedCitation).filter(
+            ExtractedCitation.email_id.like('test_core_%')).all()
+        assert sorted([c.email_id for c in stored]) == ['test_core_0'] + ['test_core_1'] * 3
+
+    def test_store_chunks_whole_emails(self, session_manager, mocker):
+        harvester = BaseHarvester(session_manager)
+        harvester.chunk_size = 2
+        insert = mocker.patch.object(harvester, '_insert_citations',
+                                     side_effect=lambda chunk: len(chunk))
+        citations = [data.extracted_citation(email_id=f'test_core_{i // 3}') for i in range(9)]
+        assert harvester.store_citations(citations) == 9
+        assert [len(call[0][0]) for call in insert.call_args_list] == [3, 3, 3]
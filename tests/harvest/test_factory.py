@@ -4,7 +4,7 @@ import pytest
 from googleapiclient import _auth, discovery
 from apiclient import errors
 from annette.stages.harvest.gmail import GmailParser
-from . import _constants as constants
+from . import _constants as constants, _fakes as fakes
 
 
 class TestGmailParser:
@@ -19,6 +19,22 @@ class TestGmailParser:
         extracted_citations = factory.parse_email(constants.email_list[0])
         assert len(extracted_citations) == 1
 
+    def test_parse_gmail_pairs_snippets(self, factory):
+        extracted_citations = factory.parse_email(constants.multi_citation_email)
+        assert [c.title for c in extracted_citations] == ['First result, without a snippet',
+                                                          'Second result']
+        assert not extracted_citations[0].snippet_match
+        assert extracted_citations[1].snippet_match
+        assert extracted_citations[1].highlight_length == 0
+
+    def test_parse_gmail_parsers_match(self, factory, mocker):
+        parsed = {}
+        for parser in ['lxml', 'html.parser']:
+            mocker.patch.object(GmailParser, 'html_parser', parser)
+            parsed[parser] = [[c.get_values() for c in factory.parse_email(email)] for email in
+                              constants.email_list + [constants.multi_citation_email]]
+        assert parsed['lxml'] == parsed['html.parser']
+
     def test_get_email_data(self, factory, mocker):
         mocker.patch('googleapiclient.http.HttpRequest.execute',
                      return_value=constants.raw_email_data_1)
@@ -41,3 +57,35 @@ class TestGmailParser:
         assert label == 'Label_1'
         label = factory._get_email_label({'labelIds': ['A', 'B']})
         assert label is None
+
+    def test_get_emails_batches_requests(self):
+        service = fakes.FakeGmailService()
+        email_ids = [f'email_{i}' for i in range(120)]
+        emails = list(GmailParser(service).get_emails(email_ids, batch_size=50))
+        assert [e['id'] for e in emails] == email_ids
+        assert service.batch_sizes == [50, 50, 20]
+        assert service.round_trips == 3
+        # marking them as read is left to the harvester
+        assert service.modified == []
+
+    def test_get_emails_skips_errors(self):
+        response = mock.MagicMock(status=418, reason='Is teapot')
+        error = errors.HttpError(response, b'Is teapot', uri='https://http.cat/418')
+        service = fakes.FakeGmailService(errors={'email_1': error})
+        emails = list(GmailParser(service).get_emails(['email_0', 'email_1', 'email_2']))
+        assert [e['id'] for e in emails] == ['email_0', 'email_2']
+
+    def test_get_emails_streams(self):
+        service = fakes.FakeGmailService()
+        emails = GmailParser(service).get_emails([f'email_{i}' for i in range(10)], batch_size=5)
+        assert service.round_trips == 0  # nothing requested until the generator is consumed
+        next(emails)
+        assert service.batch_sizes == [5]
+        list(emails)
+        assert service.batch_sizes == [5, 5]
+
+    def test_mark_emails_read(self):
+        service = fakes.FakeGmailService()
+        email_ids = [f'email_{i}' for i in range(1500)]
+        GmailParser(service).mark_emails_read(email_ids)
+        assert [m['ids'] for m in service.modified] == [email_ids[:1000], email_ids[1000:]]
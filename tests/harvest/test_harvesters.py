@@ -8,7 +8,7 @@ from googleapiclient import _auth, discovery, discovery
 from annette.stages.harvest import BaseHarvester
 from annette.stages.harvest.gmail import GmailHarvester
 from annette.db.models.citation import ExtractedCitation
-from . import _constants as constants
+from . import _constants as constants, _fakes as fakes
 
 
 class TestHarvester:
@@ -25,7 +25,13 @@ class TestHarvester:
     def test_parse_data_returns_extracted_citations(self, harvester, parse_data_input):
         if getattr(harvester.parse_data, '__isabstractmethod__', False):
             pytest.skip('Unimplemented abstract method.')
-        assert isinstance(harvester.parse_data(parse_data_input)[0], ExtractedCitation)
+        assert isinstance(list(harvester.parse_data(parse_data_input))[0], ExtractedCitation)
+
+    def test_store_citations_in_chunks(self, harvester):
+        harvester.chunk_size = 2
+        citations = (ExtractedCitation(email_id=f'email_{i}') for i in range(5))
+        assert harvester.store_citations(citations) == 5
+        assert harvester.session_manager.session.execute.call_count == 3
 
 
 class TestGmailHarvester(TestHarvester):
@@ -43,6 +49,41 @@ class TestGmailHarvester(TestHarvester):
         with mock.patch.object(self.harvester_class, 'get_credentials', return_value=service):
             return self.harvester_class(mock.MagicMock())
 
+    def test_parse_data_in_parallel(self, harvester):
+        serial = [c.get_values() for c in harvester.parse_data(constants.email_list * 5)]
+        harvester.parse_workers = 2
+        parallel = [c.get_values() for c in harvester.parse_data(constants.email_list * 5)]
+        assert parallel == serial
+
+    def test_store_citations_in_chunks(self, harvester):
+        harvester.service = fakes.FakeGmailService()
+        super(TestGmailHarvester, self).test_store_citations_in_chunks(harvester)
+        # each chunk's emails are marked as read once it's been stored
+        assert [m['ids'] for m in harvester.service.modified] == [
+            ['email_0', 'email_1'], ['email_2', 'email_3'], ['email_4']]
+
+    def test_store_citations_marks_emails_without_citations(self, harvester, mocker):
+        harvester.service = fakes.FakeGmailService()
+        mocker.patch('annette.stages.harvest.gmail.GmailHarvester.list_unread_emails',
+                     return_value=[{'id': 'email_0'}, {'id': 'email_1'}])
+        list(harvester.get_data())
+        citations = [ExtractedCitation(email_id='email_0')]
+        assert harvester.store_citations(citations) == 1
+        assert [m['ids'] for m in harvester.service.modified] == [['email_0'], ['email_1']]
+
+    def test_store_citations_failure_leaves_emails_unread(self, harvester, mocker):
+        harvester.service = fakes.FakeGmailService()
+        harvester.chunk_size = 2
+        mocker.patch('annette.stages.harvest.gmail.GmailHarvester.list_unread_emails',
+                     return_value=[{'id': f'email_{i}'} for i in range(4)])
+        list(harvester.get_data())
+        harvester.session_manager.session.execute.side_effect = [None, RuntimeError('Oh no')]
+        citations = (ExtractedCitation(email_id=f'email_{i}') for i in range(4))
+        with pytest.raises(RuntimeError):
+            harvester.store_citations(citations)
+        # only the first chunk was stored, so the other emails are picked up again next time
+        assert [m['ids'] for m in harvester.service.modified] == [['email_0', 'email_1']]
+
     def test_get_credentials(self, harvester):
         assert isinstance(harvester.service, googleapiclient.discovery.Resource)
 
@@ -113,6 +154,20 @@ class TestGmailHarvester(TestHarvester):
         assert emails is None
 
     def test_get_data(self, harvester, mocker):
+        email_id_list = [{
+            'id': '16e08a1e7b38959c',
+            'threadId': '16e08a1e7b38959c'
+            }, {
+            'id': '16e08a1e6d147fa6',
+            'threadId': '16e08a1e6d147fa6'
+            }]
+        mocker.patch('annette.stages.harvest.gmail.GmailHarvester.list_unread_emails',
+                     return_value=email_id_list)
+        mocker.patch('annette.stages.harvest.gmail.GmailParser.get_emails',
+                     return_value=constants.email_list)
+        assert list(harvester.get_data()) == constants.email_list
+
+    def test_get_data_unbatched(self, harvester, mocker):
         email_id_list = [{
             'id': '16e08a1e7b38959c',
             'threadId': '16e08a1e7b38959c'
@@ -124,4 +179,5 @@ class TestGmailHarvester(TestHarvester):
                      return_value=email_id_list)
         mocker.patch('annette.stages.harvest.gmail.GmailParser.get_email',
                      side_effect=constants.email_list)
-        assert harvester.get_data() == constants.email_list
+        harvester.batch_size = None
+        assert list(harvester.get_data()) == constants.email_list
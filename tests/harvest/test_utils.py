@@ -0,0 +1,24 @@
+from annette.stages.harvest import _utils
+from . import _constants as constants
+
+
+class TestMinimumWordDistance:
+    def test_single_token(self):
+        assert _utils.minimum_word_distance('specimens NHMUK 12345 were examined') == 0
+        assert _utils.minimum_word_distance('https://doi.org/ 10.5519 /qd.abc123') == 0
+
+    def test_full_phrase(self):
+        assert _utils.minimum_word_distance('The Natural History Museum, London') == 0
+        assert _utils.minimum_word_distance('deposited at the BM ( NH )') == 0
+
+    def test_spread_phrase(self):
+        assert _utils.minimum_word_distance(constants.email.nearly_nhm) == 4
+
+    def test_shortest_span_used(self):
+        snippet = 'natural history of London, held at the Natural History Museum, London'
+        assert _utils.minimum_word_distance(snippet) == 0
+
+    def test_not_found(self):
+        assert _utils.minimum_word_distance(constants.email.not_nhm) is None
+        assert _utils.minimum_word_distance('natural history museum') is None
+        assert _utils.minimum_word_distance('') is None
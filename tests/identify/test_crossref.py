@@ -0,0 +1,203 @@
+import threading
+import time
+from datetime import date, timedelta
+
+import mock
+import pytest
+import requests
+
+from annette.db.models import Citation, ExtractedCitation
+from annette.stages.identify import CrossRefIdentifier, IdentifyCore
+from .. import data
+
+
+def crossref_result(doi, title):
+    return {
+        'DOI': doi,
+        'title': [title],
+        'author': [{'given': 'Xavier', 'family': 'Aubriot'}],
+        'type': 'journal-article',
+        'issued': {'date-parts': [[2018, 7]]},
+        'container-title': ['American Journal of Botany'],
+        'publisher': 'Wiley'
+        }
+
+
+def crossref_response(doi, title, *others):
+    response = mock.MagicMock(ok=True)
+    results = [crossref_result(doi, title)] + [crossref_result(*other) for other in others]
+    response.json.return_value = {'message': {'items': results}}
+    return response
+
+
+class TestCrossRefIdentifier:
+    @pytest.fixture
+    def identifier(self, session_manager):
+        return CrossRefIdentifier(session_manager)
+
+    def test_get_data(self, identifier, session_manager):
+        today = date.today()
+        due = data.extracted_citation(last_identify_run=today - timedelta(days=62),
+                                      identify_attempts=2, next_identify_run=today)
+        not_due = data.extracted_citation(last_identify_run=today - timedelta(days=40),
+                                          identify_attempts=2,
+                                          next_identify_run=today + timedelta(days=22))
+        recent = data.extracted_citation(last_identify_run=today - timedelta(days=1))
+        old = data.extracted_citation(last_identify_run=today - timedelta(days=40))
+        identified = data.extracted_citation(doi='10.1002/ajb2.1133')
+        session_manager.add(due, not_due, recent, old, identified)
+        ids = {message.id for message in identifier.get_data()}
+        assert due.id in ids
+        assert old.id in ids
+        assert not_due.id not in ids
+        assert recent.id not in ids
+        assert identified.id not in ids
+
+    def test_backs_off(self, identifier):
+        message = data.extracted_citation()
+        today = date.today()
+        intervals = []
+        for _ in range(6):
+            identifier.back_off(message, today)
+            intervals.append((message.next_identify_run - today).days)
+        assert intervals == [31, 62, 124, 248, 365, 365]
+        assert message.identify_attempts == 6
+        assert message.last_identify_run == today
+
+    def test_identifies_new(self, identifier, session_manager, mocker):
+        message = data.extracted_citation(title='A new paper about eggplants')
+        session_manager.add(message)
+        mocker.patch('requests.Session.get',
+                     return_value=crossref_response('not-a-real-doi',
+                                                    'A new paper about eggplants'))
+        citations = identifier.process_data([message])
+        assert [c.doi for c in citations] == ['not-a-real-doi']
+        assert citations[0].ecid == message.id
+        assert citations[0].author == 'Aubriot, Xavier'
+        assert message.doi == 'not-a-real-doi'
+        assert message.last_identify_run == date.today()
+
+    def test_skips_known(self, identifier, session_manager, mocker):
+        # the test data already has a citation with this DOI
+        message = identifier.get_data()[0]
+        mocker.patch('requests.Session.get',
+                     return_value=crossref_response('10.1002/ajb2.1133', message.title))
+        assert identifier.process_data([message]) == []
+        assert message.doi == '10.1002/ajb2.1133'
+
+    def test_rejects_mismatch(self, identifier, session_manager, mocker):
+        message = identifier.get_data()[0]
+        mocker.patch('requests.Session.get',
+                     return_value=crossref_response('not-a-real-doi', 'Something else entirely'))
+        assert identifier.process_data([message]) == []
+        assert message.doi is None
+        assert message.last_identify_run == date.today()
+        assert message.next_identify_run == date.today() + timedelta(days=31)
+
+    def test_picks_best_result(self, identifier, session_manager, mocker):
+        message = identifier.get_data()[0]
+        mocker.patch('requests.Session.get', return_value=crossref_response(
+            'not-a-real-doi-1', 'Something else entirely',
+            ('not-a-real-doi-2', 'Shedding new light on the origin of the brinjal eggplant'),
+            ('not-a-real-doi-3', message.title.upper())))
+        citations = identifier.process_data([message])
+        assert [c.doi for c in citations] == ['not-a-real-doi-3']
+
+    def test_could_match(self, identifier):
+        title = 'shedding new light on the origin and spread of the brinjal eggplant'
+        assert identifier.could_match(title, title + ' solanum melongena')
+        # contained in the title, but too short
+        assert not identifier.could_match(title, 'the origin')
+        # similar length, but not enough words in common
+        assert not identifier.could_match(title, 'a review of the marine invertebrate '
+                                                 'collections in european museums')
+
+    def test_handles_error(self, identifier, session_manager, mocker):
+        message = identifier.get_data()[0]
+        mocker.patch('requests.Session.get', side_effect=requests.ConnectionError())
+        assert identifier.process_data([message]) == []
+        # not marked as searched, so it's tried again next time
+        assert message.last_identify_run is None
+
+    @pytest.mark.parametrize('error', [ValueError('Expecting value'), KeyError('message')])
+    def test_handles_bad_response(self, identifier, session_manager, mocker, error):
+        message = identifier.get_data()[0]
+        response = mock.MagicMock(ok=True)
+        response.json.side_effect = error
+        mocker.patch('requests.Session.get', return_value=response)
+        assert identifier.process_data([message]) == []
+        assert message.last_identify_run is None
+
+    def test_handles_missing_results(self, identifier, session_manager, mocker):
+        message = identifier.get_data()[0]
+        response = mock.MagicMock(ok=True)
+        response.json.return_value = {'status': 'error'}
+        mocker.patch('requests.Session.get', return_value=response)
+        assert identifier.process_data([message]) == []
+        assert message.last_identify_run is None
+
+    def test_searches_duplicates_once(self, identifier, session_manager, mocker):
+        messages = [data.extracted_citation(title='A new paper about eggplants', email_id='a'),
+                    data.extracted_citation(title='A New Paper About Eggplants.', email_id='b'),
+                    data.extracted_citation(title='A new paper about eggplants', pub_year=2019)]
+        session_manager.add(*messages)
+        get = mocker.patch('requests.Session.get',
+                           return_value=crossref_response('not-a-real-doi',
+                                                          'A new paper about eggplants'))
+        citations = identifier.process_data(messages)
+        # the third is from a different year so is searched for separately
+        assert get.call_count == 2
+        assert [c.doi for c in citations] == ['not-a-real-doi']
+        assert citations[0].ecid == messages[0].id
+        assert all(m.doi == 'not-a-real-doi' for m in messages)
+        assert all(m.last_identify_run == date.today() for m in messages)
+
+    def test_searches_concurrently(self, identifier, session_manager, mocker, sql_statements):
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        def _get(*args, **kwargs):
+            with lock:
+                active.append(1)
+                peak.append(len(active))
+            time.sleep(0.05)
+            with lock:
+                active.pop()
+            return crossref_response(f'not-a-real-doi-{kwargs["params"]["query"]}',
+                                     kwargs['params']['query'])
+
+        mocker.patch('requests.Session.get', side_effect=_get)
+        identifier.rate_limiter.rate = 1000
+        messages = [data.extracted_citation(title=f'Paper {i}', pub_title=None) for i in
+                    range(16)]
+        session_manager.add(*messages)
+        # expired instances are reloaded when they're next used; that has to happen here, not
+        # in the worker threads
+        session_manager.session.expire_all()
+        with sql_statements() as statements:
+            start = time.perf_counter()
+            citations = identifier.process_data(messages)
+            elapsed = time.perf_counter() - start
+        assert {s.thread for s in statements} == {threading.current_thread()}
+        assert len(citations) == 16
+        assert max(peak) > 1
+        assert elapsed < 16 * 0.05
+
+
+class TestIdentifyCore:
+    def test_run_and_store(self, session_manager, mocker):
+        message = data.extracted_citation(title='A new paper about eggplants')
+        session_manager.add(message)
+        get = mocker.patch('requests.Session.get',
+                           return_value=crossref_response('not-a-real-doi',
+                                                          'A new paper about eggplants'))
+        citations = IdentifyCore.run(session_manager)
+        # the other extracted citation is already known, so isn't searched for
+        assert get.call_count == 1
+        assert [c.doi for c in citations] == ['not-a-real-doi']
+        IdentifyCore.store(session_manager, citations)
+        assert session_manager.session.query(Citation).filter(
+            Citation.doi == 'not-a-real-doi').count() == 1
+        assert session_manager.session.query(ExtractedCitation).get(
+            message.id).doi == 'not-a-real-doi'
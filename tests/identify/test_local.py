@@ -0,0 +1,80 @@
+from datetime import date, timedelta
+
+import pytest
+
+from annette.db.models import ExtractedCitation
+from annette.stages.identify import IdentifyCore, LocalIdentifier, TitleIndex
+from .. import data
+
+
+class TestTitleIndex:
+    @pytest.fixture
+    def index(self):
+        index = TitleIndex()
+        index.add('not-a-real-doi-1', 'Shedding new light on the origin and spread of the '
+                                      'brinjal eggplant', 2018)
+        index.add('not-a-real-doi-2', 'A review of the marine invertebrate collections in '
+                                      'European museums')
+        return index
+
+    def test_exact(self, index):
+        assert index.lookup('SHEDDING new light on the origin & spread of the brinjal '
+                            'eggplant.') == 'not-a-real-doi-1'
+
+    def test_near(self, index):
+        assert index.lookup('A reveiw of the marine invertebrate collection in European '
+                            'museums') == 'not-a-real-doi-2'
+
+    def test_year(self, index):
+        title = 'Shedding new light on the origin and spread of the brinjal eggplant'
+        assert index.lookup(title, 2018) == 'not-a-real-doi-1'
+        assert index.lookup(title, 2019) is None
+        assert index.lookup(title.replace('light', 'lihgt'), 2019) is None
+
+    def test_short_titles(self, index):
+        index.add('not-a-real-doi-3', 'Editorial')
+        assert index.lookup('Editorial') is None
+
+    def test_extra_words(self, index):
+        title = 'Shedding new light on the origin and spread of the brinjal eggplant'
+        assert index.lookup(f'Correction to: {title}') is None
+        assert index.lookup(f'{title} part II') is None
+
+    def test_no_match(self, index):
+        assert index.lookup('A review of the marine vertebrates') is None
+        assert index.lookup(None) is None
+
+    def test_build(self, session_manager):
+        index = TitleIndex.build(session_manager.session)
+        assert len(index) == 1
+        assert index.lookup(data.citation().title) == data.citation().doi
+
+
+class TestLocalIdentifier:
+    def test_identifies_known(self, session_manager):
+        unknown = data.extracted_citation(title='A new paper about eggplants')
+        session_manager.add(unknown)
+        identifier = LocalIdentifier(session_manager)
+        messages = identifier.get_data()
+        assert identifier.process_data(messages) == []
+        dois = dict(session_manager.session.query(ExtractedCitation.id, ExtractedCitation.doi)
+                    .filter(ExtractedCitation.id.in_([m.id for m in messages])))
+        assert dois.pop(unknown.id) is None
+        assert set(dois.values()) == {data.citation().doi}
+
+    def test_get_data_only_due(self, session_manager):
+        today = date.today()
+        new = data.extracted_citation()
+        due = data.extracted_citation(last_identify_run=today - timedelta(days=60),
+                                      next_identify_run=today)
+        backed_off = data.extracted_citation(last_identify_run=today,
+                                             next_identify_run=today + timedelta(days=1))
+        session_manager.add(new, due, backed_off)
+        ids = {message.id for message in LocalIdentifier(session_manager).get_data()}
+        assert {new.id, due.id} <= ids
+        assert backed_off.id not in ids
+
+    def test_skips_search(self, session_manager, mocker):
+        get = mocker.patch('requests.Session.get')
+        assert IdentifyCore.run(session_manager) == []
+        get.assert_not_called()
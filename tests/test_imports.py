@@ -0,0 +1,34 @@
+import subprocess
+import sys
+
+import pytest
+
+stages = ['annette.stages.harvest', 'annette.stages.identify', 'annette.stages.enhance',
+          'annette.stages.classify']
+
+# third-party packages that should only be imported when they're actually used
+heavy_dependencies = ['apiclient', 'bs4', 'dill', 'emoji', 'googleapiclient', 'httplib2', 'nltk',
+                      'numpy', 'oauth2client', 'pandas', 'rapidfuzz', 'requests', 'sklearn']
+
+
+def imported_modules(*modules):
+    """
+    Imports the modules in a new interpreter.
+    :return: set of the names of all the modules that were imported as a result
+    """
+    code = '; '.join([f'import {m}' for m in modules] + ['import sys',
+                                                         'print("\\n".join(sys.modules))'])
+    result = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE,
+                            universal_newlines=True, check=True)
+    return set(result.stdout.splitlines())
+
+
+@pytest.mark.parametrize('stage', stages)
+def test_no_heavy_imports(stage):
+    imported = imported_modules(stage)
+    assert [d for d in heavy_dependencies if d in imported] == []
+
+
+def test_no_heavy_imports_all_stages():
+    imported = imported_modules(*stages)
+    assert [d for d in heavy_dependencies if d in imported] == []
@@ -0,0 +1,25 @@
+from sqlalchemy import MetaData, Table, inspect
+
+from annette.db.models import ExtractedCitation
+
+
+def test_create_upgrades_existing_tables(session_manager):
+    # extractedcitations as it was before the identify back-off columns were added
+    new_columns = ['identify_attempts', 'next_identify_run']
+    old_table = Table(ExtractedCitation.__tablename__, MetaData(),
+                      *[c.copy() for c in ExtractedCitation.__table__.columns
+                        if c.name not in new_columns])
+    session_manager.drop()
+    old_table.create(session_manager._engine)
+    session_manager._engine.execute(old_table.insert().values(email_id='test_session_0'))
+
+    session_manager.create()
+
+    inspector = inspect(session_manager._engine)
+    columns = {c['name'] for c in inspector.get_columns(ExtractedCitation.__tablename__)}
+    assert set(new_columns) <= columns
+    indexes = {i['name'] for i in inspector.get_indexes(ExtractedCitation.__tablename__)}
+    assert 'extractedcitations_identify' in indexes
+    stored = session_manager.session.query(ExtractedCitation).one()
+    assert stored.identify_attempts == 0
+    assert stored.next_identify_run is None
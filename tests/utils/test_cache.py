@@ -0,0 +1,71 @@
+from datetime import timedelta
+
+import mock
+import pytest
+
+from annette.utils.cache import ResponseCache
+
+
+class TestResponseCache:
+    ttl = timedelta(days=1)
+
+    @pytest.fixture
+    def cache(self, tmp_path):
+        return ResponseCache(str(tmp_path / 'cache.sqlite'))
+
+    def test_caches_response(self, cache):
+        fetch = mock.Mock(return_value={'times_cited': 123})
+        assert cache.lookup('test', 'key', fetch, self.ttl) == {'times_cited': 123}
+        assert cache.lookup('test', 'key', fetch, self.ttl) == {'times_cited': 123}
+        assert fetch.call_count == 1
+        assert cache.stats() == {'test': {'hits': 1, 'misses': 1}}
+
+    def test_caches_none(self, cache):
+        fetch = mock.Mock(return_value=None)
+        cache.lookup('test', 'key', fetch, self.ttl)
+        assert cache.lookup('test', 'key', fetch, self.ttl) is None
+        assert fetch.call_count == 1
+
+    def test_keys_by_source(self, cache):
+        cache.lookup('test_1', 'key', lambda: 1, self.ttl)
+        assert cache.lookup('test_2', 'key', lambda: 2, self.ttl) == 2
+
+    def test_expires(self, cache):
+        cache.lookup('test', 'key', lambda: 1, self.ttl)
+        assert cache.lookup('test', 'key', lambda: 2, timedelta(0)) == 2
+
+    def test_doesnt_cache_errors(self, cache):
+        with pytest.raises(ValueError):
+            cache.lookup('test', 'key', mock.Mock(side_effect=ValueError), self.ttl)
+        assert cache.lookup('test', 'key', lambda: 1, self.ttl) == 1
+
+    def test_lookup_many(self, cache):
+        cache.lookup('test', 'key_1', lambda: 1, self.ttl)
+        fetch = mock.Mock(return_value={'key_2': 2})
+        assert cache.lookup_many('test', ['key_1', 'key_2', 'key_3'], fetch, self.ttl) == {
+            'key_1': 1, 'key_2': 2, 'key_3': None}
+        fetch.assert_called_once_with(['key_2', 'key_3'])
+        # everything is cached now, so there's nothing left to fetch
+        cache.lookup_many('test', ['key_1', 'key_2', 'key_3'], fetch, self.ttl)
+        assert fetch.call_count == 1
+
+    def test_persists(self, tmp_path):
+        path = str(tmp_path / 'cache.sqlite')
+        ResponseCache(path).lookup('test', 'key', lambda: 1, self.ttl)
+        assert ResponseCache(path).lookup('test', 'key', lambda: 2, self.ttl) == 1
+
+    def test_evicts_least_recently_used(self, tmp_path):
+        cache = ResponseCache(str(tmp_path / 'cache.sqlite'), max_entries=10)
+        for i in range(10):
+            cache.lookup('test', f'key_{i}', lambda: i, self.ttl)
+        cache.lookup('test', 'key_0', lambda: None, self.ttl)  # key_0 is now the most recent
+        cache.lookup('test', 'key_10', lambda: 10, self.ttl)
+        assert cache.lookup('test', 'key_0', lambda: None, self.ttl) == 0
+        assert cache.lookup('test', 'key_1', lambda: None, self.ttl) is None
+
+    def test_disabled(self):
+        cache = ResponseCache(None)
+        fetch = mock.Mock(return_value=1)
+        cache.lookup('test', 'key', fetch, self.ttl)
+        cache.lookup('test', 'key', fetch, self.ttl)
+        assert fetch.call_count == 2
@@ -0,0 +1,11 @@
+from annette.utils.chunks import chunked, in_list_size
+
+
+class TestChunked:
+    def test_chunks(self):
+        assert list(chunked(range(5), 2)) == [[0, 1], [2, 3], [4]]
+        assert list(chunked([], 2)) == []
+
+    def test_chunks_generators(self):
+        items = (i for i in range(in_list_size + 1))
+        assert [len(chunk) for chunk in chunked(items)] == [in_list_size, 1]
@@ -0,0 +1,28 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from annette.utils.rate import RateLimiter
+
+
+class TestRateLimiter:
+    def test_burst_is_immediate(self):
+        limiter = RateLimiter(1, burst=5)
+        start = time.monotonic()
+        for _ in range(5):
+            limiter.acquire()
+        assert time.monotonic() - start < 0.5
+
+    def test_limits_rate(self):
+        limiter = RateLimiter(20)
+        start = time.monotonic()
+        for _ in range(11):
+            limiter.acquire()
+        # the first is immediate, then 10 more at 20 per second
+        assert time.monotonic() - start >= 0.5
+
+    def test_limits_rate_across_threads(self):
+        limiter = RateLimiter(20)
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(lambda _: limiter.acquire(), range(11)))
+        assert time.monotonic() - start >= 0.5
@@ -0,0 +1,55 @@
+import os
+
+import dill
+import numpy as np
+import pytest
+
+from annette.utils.registry import ModelRegistry
+
+
+class TestModelRegistry:
+    @pytest.fixture
+    def model_path(self, tmp_path):
+        path = str(tmp_path / 'model.pk')
+        self.save({'weights': np.arange(10)}, path)
+        return path
+
+    @staticmethod
+    def save(model, path):
+        with open(path, 'wb') as f:
+            dill.dump(model, f)
+
+    def test_loads_once(self, model_path, mocker):
+        load = mocker.spy(dill, 'load')
+        registry = ModelRegistry()
+        model = registry.get(model_path)
+        assert registry.get(model_path) is model
+        assert load.call_count == 1
+
+    def test_reloads_changed(self, model_path):
+        registry = ModelRegistry()
+        model = registry.get(model_path)
+        self.save({'weights': np.arange(5)}, model_path)
+        # make sure the modification time changes even on coarse-grained file systems
+        stat = os.stat(model_path)
+        os.utime(model_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        reloaded = registry.get(model_path)
+        assert reloaded is not model
+        assert len(reloaded['weights']) == 5
+
+    def test_ignores_touched(self, model_path):
+        registry = ModelRegistry()
+        model = registry.get(model_path)
+        stat = os.stat(model_path)
+        os.utime(model_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        assert registry.get(model_path) is model
+
+    def test_memory_maps(self, model_path, tmp_path):
+        mmap_dir = str(tmp_path / 'mmap')
+        model = ModelRegistry(mmap_dir).get(model_path)
+        assert isinstance(model['weights'], np.memmap)
+        assert list(model['weights']) == list(range(10))
+        # a new process (registry) uses the same copy
+        assert len(os.listdir(mmap_dir)) == 1
+        ModelRegistry(mmap_dir).get(model_path)
+        assert len(os.listdir(mmap_dir)) == 1